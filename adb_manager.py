@@ -7,6 +7,37 @@ import time
 import socket
 import platform
 import sys
+import shlex
+import re
+import struct
+import functools
+import queue
+import uuid
+import json
+import hashlib
+import asyncio
+import codecs
+import collections
+import signal
+import random
+import tarfile
+import posixpath
+import shutil
+import gc
+import zlib
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from PIL import Image  # Opcional: capturas en WebP
+except ImportError:
+    Image = None
+
+try:
+    import av  # Opcional: decodificación H.264 de la vista previa
+except ImportError:
+    av = None
 
 # ========== CONFIGURACIÓN GLOBAL ==========
 APP_VERSION = "1.2"
@@ -19,6 +50,75 @@ DEFAULT_IP = "192.168.1.80"
 WINDOW_WIDTH = 900
 WINDOW_HEIGHT = 1000
 
+# CONFIGURACIÓN DEL SERVIDOR ADB
+ADB_SERVER_HOST = "127.0.0.1"
+ADB_SERVER_PORT = int(os.environ.get("ANDROID_ADB_SERVER_PORT", "5037"))
+USE_NATIVE_ADB = True  # Hablar directamente con el servidor ADB (sin lanzar adb.exe)
+SHELL_SESSION_TIMEOUT = 30  # Segundos máximos por comando en la sesión shell persistente
+SHELL_HEALTH_INTERVAL = 30  # Segundos de inactividad tras los que se comprueba la sesión
+JOB_WORKERS = 16  # Tareas ejecutándose a la vez (resto en cola por prioridad)
+STREAM_FLUSH_MS = 50  # Intervalo de volcado de la salida en streaming a la consola
+
+# CONFIGURACIÓN DE CONSOLA Y LOG
+CONSOLE_BUFFER_LINES = 100000  # Líneas guardadas de la salida de la consola
+LOG_BUFFER_LINES = 20000  # Líneas guardadas del log del sistema
+WIDGET_VISIBLE_LINES = 2000  # Líneas que se mantienen en cada widget de texto
+UI_FLUSH_MS = 33  # Volcado de log y consola a ~30 Hz como máximo
+LOGCAT_BUFFER_RECORDS = 200000  # Registros de logcat guardados por dispositivo
+LOGCAT_VISIBLE_LINES = 5000  # Líneas que se mantienen en el visor de logcat
+LOGCAT_BACKLOG = 2000  # Líneas ya existentes que se piden al abrir el visor (-T)
+LOGCAT_BINARY = True  # Leer 'logcat -B' (sin expresiones regulares) en lugar de texto
+LOGCAT_FILTER_DELAY_MS = 150  # Espera tras teclear un filtro antes de aplicarlo
+LOGCAT_LEVELS = "VDIWEF"  # De menos a más grave
+LOGCAT_COLORS = {'V': '#7f8c8d', 'D': '#5dade2', 'I': '#2ecc71', 'W': '#f39c12',
+                 'E': '#e74c3c', 'F': '#ff00ff'}
+
+# CONFIGURACIÓN DE TRANSFERENCIAS
+TRANSFER_STALL_TIMEOUT = 30  # Segundos sin avanzar un byte antes de abortar
+TRANSFER_UPDATE_INTERVAL = 0.2  # Segundos entre actualizaciones de progreso
+TRANSFER_STREAMS = 4  # Sesiones sync simultáneas por dispositivo al enviar carpetas
+SMALL_FILE_LIMIT = 1024 * 1024  # Por debajo se agrupan en una única sesión sync
+SYNC_PIPELINE = 32  # Archivos enviados sin esperar su confirmación
+RESUME_VERIFY_BYTES = 1024 * 1024  # Cola del .partial que se comprueba antes de reanudar
+VERIFY_TIMEOUT = 600  # Segundos para sha256sum/md5sum de archivos grandes en el dispositivo
+MANIFEST_DIR = os.path.join(os.path.expanduser("~"), ".adb_manager", "manifests")  # Caché de sincronización
+TRANSFER_STATS_PATH = os.path.join(os.path.expanduser("~"), ".adb_manager", "transfer_stats.json")
+COMPRESSION_CODECS = ("zstd", "lz4", "brotli")  # Por orden de preferencia (adb push/pull -z)
+INCOMPRESSIBLE_EXTENSIONS = {
+    ".apk", ".aab", ".zip", ".rar", ".7z", ".gz", ".xz", ".bz2", ".zst", ".br", ".lz4",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".mp3", ".aac", ".ogg", ".opus",
+    ".flac", ".m4a", ".mp4", ".mkv", ".avi", ".mov", ".webm", ".3gp", ".pdf", ".obb",
+}
+
+# CONFIGURACIÓN DE CAPTURAS
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+BURST_FPS = 5  # Capturas por segundo por defecto en modo ráfaga
+BURST_PNG_LEVEL = 1  # Compresión zlib de la ráfaga (prima la velocidad)
+BURST_MAX_PENDING = 16  # Fotogramas esperando codificación antes de frenar la captura
+PREVIEW_BIT_RATE = 4000000  # Bits/s pedidos a screenrecord para la vista previa
+PREVIEW_POLL_MS = 15  # Intervalo con el que Tk recoge el último fotograma
+RECORD_SEGMENT_SECONDS = 180  # Límite de screenrecord; se encadenan segmentos
+RECORD_REMOTE_DIR = "/sdcard"  # Segmentos en curso en el dispositivo (como mucho dos a la vez)
+RECORD_CLOSE_TIMEOUT = 10  # Segundos que se espera a que screenrecord cierre el MP4
+RAW_FORMATS = {1: ("RGBA", 4), 2: ("RGBX", 4), 3: ("RGB", 3), 5: ("BGRA", 4)}  # screencap sin -p
+
+# CONFIGURACIÓN DEL ESCANEO DE RED
+SCAN_CONCURRENCY = 256  # Conexiones TCP simultáneas
+SCAN_TIMEOUT = 1.5  # Plazo por host (Windows tarda ~1 s en devolver un RST)
+SCAN_RATE = 3000  # Conexiones nuevas por segundo como máximo
+ADB_TCP_PORT = 5555
+WIRELESS_PORT_RANGE = (30000, 49999)  # Depuración inalámbrica (Android 11+)
+
+# CONFIGURACIÓN DE DESCUBRIMIENTO mDNS
+MDNS_GROUP = "224.0.0.251"
+MDNS_PORT = 5353
+MDNS_QUERY_INTERVAL = 10  # Segundos entre consultas activas
+ADB_CONNECT_SERVICE = "_adb-tls-connect._tcp"
+ADB_PAIRING_SERVICE = "_adb-tls-pairing._tcp"
+
+# Evitar ventanas de consola al lanzar procesos en Windows
+SUBPROCESS_FLAGS = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
 def get_resource_path(relative_path):
     """Obtener ruta de recursos incluidos en el ejecutable"""
     try:
@@ -29,8 +129,9 @@ def get_resource_path(relative_path):
     
     return os.path.join(base_path, relative_path)
 
+@functools.lru_cache(maxsize=None)
 def get_adb_path():
-    """Obtener ruta del adb.exe incluido"""
+    """Obtener ruta del adb.exe incluido (se resuelve una sola vez)"""
     # Intentar diferentes ubicaciones
     possible_paths = [
         get_resource_path("adb_tools/adb.exe"),  # Empaquetado
@@ -46,6 +147,2597 @@ def get_adb_path():
     
     return "adb"  # Fallback al PATH del sistema
 
+def wait_until(condition, timeout, initial_delay=0.05, max_delay=1.0):
+    """Sondear condition() con espera exponencial hasta que se cumpla o venza el plazo.
+    
+    Devuelve (cumplida, segundos transcurridos).
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = initial_delay
+    while True:
+        try:
+            if condition():
+                return True, time.monotonic() - start
+        except Exception:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, time.monotonic() - start
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+# ========== CLIENTE ADB NATIVO ==========
+class ADBError(Exception):
+    """Error devuelto por el servidor ADB (respuesta FAIL)"""
+
+class ADBClient:
+    """Cliente del protocolo smart-socket del servidor ADB (127.0.0.1:5037)
+    
+    Cada petición abre un socket TCP al servidor y envía '<longitud hex 4><petición>'.
+    El servidor responde 'OKAY' o 'FAIL' + mensaje con longitud. Permite probarlo
+    contra un servidor falso indicando otro host/puerto.
+    """
+    
+    SHELL_EXIT_MARKER = "__ADBM_RC__:"
+    
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+    
+    # --- Primitivas del protocolo ---
+    def _connect(self, timeout=None):
+        sock = socket.create_connection((self.host, self.port),
+                                        timeout=self.timeout if timeout is None else timeout)
+        # Peticiones sync pequeñas y seguidas: sin Nagle cada una espera un ACK retrasado
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    
+    @staticmethod
+    def _send_request(sock, request):
+        data = request.encode('utf-8')
+        sock.sendall(b"%04x" % len(data) + data)
+    
+    @staticmethod
+    def _recv_exact(sock, size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 65536))
+            if not chunk:
+                raise ConnectionError("Conexión cerrada por el servidor ADB")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+    
+    @staticmethod
+    def _recv_all(sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+    
+    def _read_length_prefixed(self, sock):
+        length = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, length)
+    
+    def _read_status(self, sock):
+        status = self._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise ADBError(self._read_length_prefixed(sock).decode('utf-8', 'replace'))
+        raise ADBError(f"Respuesta inesperada del servidor: {status!r}")
+    
+    # --- Servicios host: ---
+    def is_available(self, timeout=0.5):
+        """Comprobar si el servidor ADB acepta conexiones"""
+        try:
+            self._connect(timeout=timeout).close()
+            return True
+        except OSError:
+            return False
+    
+    def host_command(self, request, timeout=None):
+        """Ejecutar servicio host:* que responde con un mensaje con longitud"""
+        with self._connect(timeout) as sock:
+            self._send_request(sock, request)
+            self._read_status(sock)
+            return self._read_length_prefixed(sock).decode('utf-8', 'replace')
+    
+    def host_command_noreply(self, request, timeout=None):
+        """Ejecutar servicio host:* que solo responde OKAY (ej. host:kill)"""
+        with self._connect(timeout) as sock:
+            self._send_request(sock, request)
+            self._read_status(sock)
+    
+    def version(self):
+        """Versión interna del servidor ADB (entero)"""
+        return int(self.host_command("host:version"), 16)
+    
+    def devices(self, long=False):
+        """Texto de 'host:devices' (o 'host:devices-l')"""
+        return self.host_command("host:devices-l" if long else "host:devices")
+    
+    def connect(self, target):
+        return self.host_command(f"host:connect:{target}")
+    
+    def disconnect(self, target=""):
+        return self.host_command(f"host:disconnect:{target}")
+    
+    def features(self, serial):
+        """Características del dispositivo (ej. 'sendrecv_v2_zstd')"""
+        return set(self.host_command(f"host-serial:{serial}:features").split(","))
+    
+    def host_features(self):
+        """Características del propio servidor ADB"""
+        return set(self.host_command("host:host-features").split(","))
+    
+    def get_state(self, serial=None):
+        request = f"host-serial:{serial}:get-state" if serial else "host:get-state"
+        return self.host_command(request)
+    
+    def kill_server(self):
+        self.host_command_noreply("host:kill")
+    
+    def open_host_stream(self, request):
+        """Abrir servicio host:* de larga duración (ej. host:track-devices-l)"""
+        sock = self._connect(timeout=None)
+        try:
+            self._send_request(sock, request)
+            self._read_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)  # Puede pasar mucho tiempo sin cambios: solo el handshake tiene plazo
+        return sock
+    
+    def read_message(self, sock):
+        """Leer el siguiente mensaje con longitud de un servicio host:*"""
+        return self._read_length_prefixed(sock).decode('utf-8', 'replace')
+    
+    # --- Servicios de dispositivo ---
+    def open_transport(self, serial=None, timeout=None):
+        """Abrir socket ya conmutado al transporte del dispositivo"""
+        sock = self._connect(timeout)
+        try:
+            self._send_request(sock, f"host:transport:{serial}" if serial else "host:transport-any")
+            self._read_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    
+    def open_service(self, serial, service, timeout=None):
+        """Abrir un servicio de dispositivo (shell:, exec:, sync:...) y devolver el socket"""
+        sock = self.open_transport(serial, timeout)
+        try:
+            self._send_request(sock, service)
+            self._read_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    
+    def open_stream(self, serial, service):
+        """Abrir un servicio de larga duración que puede pasar tiempo sin enviar datos"""
+        sock = self.open_service(serial, service)
+        sock.settimeout(None)  # Solo el handshake tiene plazo
+        return sock
+    
+    def shell(self, serial, command, timeout=30):
+        """Ejecutar 'shell:<comando>' y devolver (código, stdout, stderr)
+        
+        El protocolo shell v1 no transmite el código de salida, así que se
+        añade un marcador final con '$?'.
+        """
+        wrapped = f"{command}\necho \"{self.SHELL_EXIT_MARKER}$?\""
+        with self.open_service(serial, f"shell:{wrapped}", timeout) as sock:
+            output = self._recv_all(sock).decode('utf-8', 'replace')
+        
+        code = 0
+        index = output.rfind(self.SHELL_EXIT_MARKER)
+        if index != -1:
+            try:
+                code = int(output[index + len(self.SHELL_EXIT_MARKER):].strip())
+            except ValueError:
+                code = 0
+            output = output[:index]
+        return code, output, ""
+    
+    def exec_out(self, serial, command, timeout=30):
+        """Ejecutar 'exec:<comando>' y devolver la salida binaria intacta"""
+        with self.open_service(serial, f"exec:{command}", timeout) as sock:
+            return self._recv_all(sock)
+    
+    def exec_to_file(self, serial, command, target, timeout=30):
+        """Volcar la salida binaria de 'exec:<comando>' en un archivo abierto; devuelve los bytes"""
+        written = 0
+        with self.open_service(serial, f"exec:{command}", timeout) as sock:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return written
+                target.write(chunk)
+                written += len(chunk)
+    
+    def open_sync(self, serial, timeout=None):
+        """Abrir una sesión del protocolo 'sync:'"""
+        return SyncConnection(self.open_service(serial, "sync:", timeout))
+
+class SyncConnection:
+    """Sesión del protocolo sync de ADB sobre un socket ya abierto"""
+    
+    DATA_MAX = 64 * 1024  # Tamaño máximo de un bloque DATA
+    
+    def __init__(self, sock):
+        self.sock = sock
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _send_request(self, command, path):
+        data = path.encode('utf-8')
+        self.sock.sendall(command + struct.pack("<I", len(data)) + data)
+    
+    def stat(self, path):
+        """Devolver (modo, tamaño, mtime) del archivo remoto; modo 0 si no existe"""
+        self._send_request(b"STAT", path)
+        response = ADBClient._recv_exact(self.sock, 16)
+        if response[:4] != b"STAT":
+            raise ADBError(f"Respuesta sync inesperada: {response[:4]!r}")
+        return struct.unpack("<III", response[4:])
+    
+    def stat_v2(self, path):
+        """Como stat() pero con tamaño de 64 bits (STA2, característica 'stat_v2')"""
+        self._send_request(b"STA2", path)
+        response = ADBClient._recv_exact(self.sock, 72)
+        if response[:4] != b"STA2":
+            raise ADBError(f"Respuesta sync inesperada: {response[:4]!r}")
+        error, _, _, mode, _, _, _, size, _, mtime, _ = struct.unpack("<IQQIIIIQqqq", response[4:])
+        if error:
+            return 0, 0, 0
+        return mode, size, mtime
+    
+    def _read_header(self):
+        header = ADBClient._recv_exact(self.sock, 8)
+        return header[:4], struct.unpack("<I", header[4:])[0]
+    
+    def _raise_fail(self, length):
+        message = ADBClient._recv_exact(self.sock, length).decode('utf-8', 'replace')
+        raise ADBError(message)
+    
+    def send(self, source, remote_path, mode=0o644, mtime=None, on_progress=None, wait=True):
+        """Enviar el archivo abierto `source` a remote_path (SEND/DATA/DONE).
+        
+        on_progress(bytes) se llama tras cada bloque enviado. Con wait=False
+        no se espera la confirmación; hay que leerla luego con
+        read_send_status() en el mismo orden de envío.
+        """
+        self._send_request(b"SEND", f"{remote_path},{0o100000 | (mode & 0o777)}")
+        while True:
+            data = source.read(self.DATA_MAX)
+            if not data:
+                break
+            self.sock.sendall(b"DATA" + struct.pack("<I", len(data)) + data)
+            if on_progress:
+                on_progress(len(data))
+        if mtime is None:
+            mtime = time.time()
+        self.sock.sendall(b"DONE" + struct.pack("<I", int(mtime)))
+        if wait:
+            self.read_send_status()
+    
+    def read_send_status(self):
+        """Leer la confirmación de un SEND (OKAY o FAIL con mensaje)"""
+        status, length = self._read_header()
+        if status == b"FAIL":
+            self._raise_fail(length)
+        if status != b"OKAY":
+            raise ADBError(f"Respuesta sync inesperada: {status!r}")
+    
+    def recv(self, remote_path, target, on_progress=None):
+        """Escribir remote_path en el archivo abierto `target` (RECV/DATA/DONE)"""
+        self._send_request(b"RECV", remote_path)
+        while True:
+            status, length = self._read_header()
+            if status == b"DONE":
+                return
+            if status == b"FAIL":
+                self._raise_fail(length)
+            if status != b"DATA":
+                raise ADBError(f"Respuesta sync inesperada: {status!r}")
+            target.write(ADBClient._recv_exact(self.sock, length))
+            if on_progress:
+                on_progress(length)
+    
+    def list(self, path):
+        """Entradas del directorio remoto como [(nombre, modo, tamaño, mtime)]"""
+        self._send_request(b"LIST", path)
+        entries = []
+        while True:
+            response = ADBClient._recv_exact(self.sock, 20)
+            if response[:4] == b"DONE":
+                return entries
+            if response[:4] != b"DENT":
+                raise ADBError(f"Respuesta sync inesperada: {response[:4]!r}")
+            mode, size, mtime, length = struct.unpack("<IIII", response[4:])
+            name = ADBClient._recv_exact(self.sock, length).decode('utf-8', 'replace')
+            if name not in (".", ".."):
+                entries.append((name, mode, size, mtime))
+    
+    def close(self):
+        try:
+            self.sock.sendall(b"QUIT" + struct.pack("<I", 0))
+        except OSError:
+            pass
+        self.sock.close()
+
+class TransferProgress:
+    """Bytes transferidos, velocidad y tiempo restante de una o varias transferencias
+    
+    add() es seguro desde varios hilos; on_update(hechos, total, bytes/s, eta)
+    se llama como mucho cada TRANSFER_UPDATE_INTERVAL segundos.
+    """
+    
+    def __init__(self, total=0, on_update=None):
+        self.total = total
+        self.done = 0
+        self.entries = 0  # Archivos terminados (descargas de carpetas)
+        self.on_update = on_update
+        self.started = time.monotonic()
+        self.last_update = 0.0
+        self.lock = threading.Lock()
+    
+    def add_total(self, size):
+        with self.lock:
+            self.total += size
+    
+    def add(self, size, force=False, entries=0):
+        with self.lock:
+            self.done += size
+            self.entries += entries
+            now = time.monotonic()
+            if not force and now - self.last_update < TRANSFER_UPDATE_INTERVAL:
+                return
+            self.last_update = now
+            done, total = self.done, max(self.total, self.done)
+        if self.on_update:
+            rate = self.rate()
+            eta = (total - done) / rate if rate and total > done else 0.0
+            self.on_update(done, total, rate, eta)
+    
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+    
+    def finish(self):
+        self.add(0, force=True)
+
+class TreePush:
+    """Envío de muchos archivos a un dispositivo
+    
+    Los archivos pequeños van seguidos por una única sesión sync sin esperar
+    la confirmación de cada uno; los grandes se reparten en hasta `streams`
+    sesiones simultáneas. run() devuelve {ruta remota: error o None}.
+    """
+    
+    def __init__(self, serial, entries, progress=None, streams=TRANSFER_STREAMS):
+        self.serial = serial
+        self.entries = entries  # [(ruta local, ruta remota)]
+        self.progress = progress
+        self.streams = streams
+        self.client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+    
+    def _on_progress(self):
+        return self.progress.add if self.progress else None
+    
+    def run(self):
+        small, large = [], []
+        for local, remote in self.entries:
+            try:
+                size = os.path.getsize(local)
+            except OSError:
+                size = 0  # El error se informa al intentar abrirlo
+            (small if size < SMALL_FILE_LIMIT else large).append((local, remote))
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.streams) as executor:
+            futures = [executor.submit(self._push_small, small)] if small else []
+            futures += [executor.submit(self._push_large, local, remote) for local, remote in large]
+            for future in futures:
+                results.update(future.result())
+        return results
+    
+    def _push_large(self, local, remote):
+        try:
+            stat = os.stat(local)
+            with self.client.open_sync(self.serial) as sync, open(local, 'rb') as source:
+                sync.send(source, remote, stat.st_mode, stat.st_mtime, self._on_progress())
+        except (OSError, ADBError) as e:
+            return {remote: str(e) or e.__class__.__name__}
+        return {remote: None}
+    
+    def _count(self, sent, size):
+        """Progreso de un envío sin confirmar, recordando cuánto lleva"""
+        sent[0] += size
+        if self.progress:
+            self.progress.add(size)
+    
+    def _push_small(self, files):
+        results = {}
+        pending = collections.deque(files)
+        suspects = set()  # Lote de un FAIL aún sin resolver: se envía de uno en uno
+        while pending:
+            unacked = collections.deque()
+            try:
+                with self.client.open_sync(self.serial) as sync:
+                    while pending or unacked:
+                        window = 1 if suspects else SYNC_PIPELINE
+                        if pending and len(unacked) < window:
+                            local, remote = pending.popleft()
+                            try:
+                                stat = os.stat(local)
+                                source = open(local, 'rb')
+                            except OSError as e:
+                                results[remote] = str(e)
+                                suspects.discard(remote)
+                                continue
+                            sent = [0]
+                            unacked.append((local, remote, sent))
+                            with source:
+                                sync.send(source, remote, stat.st_mode, stat.st_mtime,
+                                          functools.partial(self._count, sent), wait=False)
+                        else:
+                            sync.read_send_status()
+                            remote = unacked.popleft()[1]
+                            results[remote] = None
+                            suspects.discard(remote)
+            except (OSError, ADBError) as e:
+                error = str(e) or e.__class__.__name__
+                if not unacked:
+                    # No se pudo abrir la sesión: el dispositivo no está disponible
+                    for _, remote in pending:
+                        results[remote] = error
+                    break
+                if self.progress:
+                    # Lo no confirmado falló o se reenviará: descontar sus bytes
+                    self.progress.add(-sum(sent[0] for _, _, sent in unacked))
+                if suspects:
+                    remote = unacked.popleft()[1]
+                    results[remote] = error
+                    suspects.discard(remote)
+                else:
+                    # Tras un FAIL el dispositivo cierra la sesión y no se sabe qué
+                    # archivo falló: reenviar los no confirmados de uno en uno hasta
+                    # resolverlos todos, y solo entonces volver a encadenar
+                    suspects.update(remote for _, remote, _ in unacked)
+                pending.extendleft((local, remote) for local, remote, _ in reversed(unacked))
+        return results
+
+class ResumablePull:
+    """Descarga de un archivo grande que se puede reanudar
+    
+    Los datos van a '<destino>.partial' junto a un '.partial.json' con el
+    tamaño y mtime remotos. Si la descarga se corta, el siguiente intento
+    comprueba el final del .partial contra el dispositivo y continúa desde
+    ese offset con 'tail -c'. Al terminar se compara un hash del archivo
+    completo con sha256sum (o md5sum) del dispositivo.
+    """
+    
+    def __init__(self, serial, remote_path, local_path, progress=None, log=None, codec=None):
+        self.serial = serial
+        self.codec = codec  # Compresión para descargas desde cero (adb pull -z)
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.partial_path = local_path + ".partial"
+        self.meta_path = self.partial_path + ".json"
+        self.progress = progress
+        self.log = log or (lambda message: None)
+        self.client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+        self.transfer_seconds = 0.0
+    
+    def _on_progress(self):
+        return self.progress.add if self.progress else None
+    
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _remove_partial(self):
+        for path in (self.partial_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _remote_md5(self, offset, length):
+        command = (f"tail -c +{offset + 1} {shlex.quote(self.remote_path)} | "
+                   f"head -c {length} | md5sum")
+        _, output, _ = self.client.shell(self.serial, command, timeout=VERIFY_TIMEOUT)
+        return output.split()[0] if output.split() else None
+    
+    def resume_offset(self, size, mtime):
+        """Bytes del .partial que coinciden con el archivo remoto actual"""
+        meta = self._read_meta()
+        if not os.path.exists(self.partial_path) or meta != {
+                "remote": self.remote_path, "size": size, "mtime": mtime}:
+            return 0
+        offset = min(os.path.getsize(self.partial_path), size)
+        start = max(0, offset - RESUME_VERIFY_BYTES)
+        with open(self.partial_path, 'rb') as f:
+            f.seek(start)
+            local_md5 = hashlib.md5(f.read(offset - start)).hexdigest()
+        if offset == 0 or self._remote_md5(start, offset - start) != local_md5:
+            return 0
+        return offset
+    
+    def remote_digest(self):
+        """(algoritmo, hash) calculado en el dispositivo, o (None, None)"""
+        for algorithm in ("sha256", "md5"):
+            code, output, _ = self.client.shell(
+                self.serial, f"{algorithm}sum {shlex.quote(self.remote_path)}", timeout=VERIFY_TIMEOUT)
+            digest = output.split()[0] if output.split() else ""
+            if code == 0 and re.fullmatch(r"[0-9a-f]{32,64}", digest):
+                return algorithm, digest
+        return None, None
+    
+    def local_digest(self, algorithm):
+        digest = hashlib.new(algorithm)
+        with open(self.partial_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def remote_stat(self):
+        """(modo, tamaño, mtime) remotos con el tamaño completo de archivos de 4 GiB o más
+        
+        STAT v1 solo da 32 bits; sin 'stat_v2' el tamaño se pide a 'stat -c %s'.
+        """
+        try:
+            features = self.client.features(self.serial)
+        except (OSError, ADBError):
+            features = set()
+        with self.client.open_sync(self.serial) as sync:
+            if "stat_v2" in features:
+                return sync.stat_v2(self.remote_path)
+            mode, size, mtime = sync.stat(self.remote_path)
+        if mode:
+            code, output, _ = self.client.shell(self.serial, f"stat -c %s {shlex.quote(self.remote_path)}")
+            if code == 0 and output.strip().isdigit():
+                size = int(output.strip())
+        return mode, size, mtime
+    
+    def run(self):
+        """Descargar (o continuar) y verificar; si se corta se conserva el .partial"""
+        mode, size, mtime = self.remote_stat()
+        if mode == 0:
+            raise ADBError(f"No existe: {self.remote_path}")
+        
+        offset = self.resume_offset(size, mtime)
+        if self.progress:
+            self.progress.add_total(size - offset)
+        if offset:
+            self.log(f"⏯️ Reanudando {os.path.basename(self.local_path)} desde {format_size(offset)}")
+        else:
+            self._remove_partial()
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"remote": self.remote_path, "size": size, "mtime": mtime}, f)
+        
+        started = time.monotonic()
+        if offset == 0 and self.codec:
+            def written():
+                return os.path.getsize(self.partial_path) if os.path.exists(self.partial_path) else 0
+            try:
+                run_adb_transfer(self.serial, "pull", self.codec, self.remote_path, self.partial_path,
+                                 written, size, self.progress)
+            except ADBError:
+                # Un corte (OSError, socket.timeout) conserva el .partial: se reanuda con tail
+                self._remove_partial()
+                raise
+        else:
+            with open(self.partial_path, 'ab' if offset else 'wb') as target:
+                try:
+                    if offset < size:
+                        self._fetch(target, offset)
+                except ADBError:
+                    target.close()
+                    self._remove_partial()
+                    raise
+        self.transfer_seconds = time.monotonic() - started  # Sin la verificación del hash
+        
+        received = os.path.getsize(self.partial_path)
+        if received != size:
+            raise ConnectionError(f"Descarga incompleta: {format_size(received)} de {format_size(size)}")
+        
+        algorithm, expected = self.remote_digest()
+        if algorithm is None:
+            self.log("⚠️ El dispositivo no tiene sha256sum/md5sum: se omite la verificación")
+        elif self.local_digest(algorithm) != expected:
+            self._remove_partial()
+            raise ADBError(f"El {algorithm} no coincide con el del dispositivo")
+        
+        os.replace(self.partial_path, self.local_path)
+        os.remove(self.meta_path)
+        os.utime(self.local_path, (mtime, mtime))
+        return algorithm
+    
+    def _fetch(self, target, offset):
+        if offset == 0:
+            with self.client.open_sync(self.serial) as sync:
+                sync.recv(self.remote_path, target, self._on_progress())
+            return
+        
+        # Lectura desde un offset: el protocolo sync v1 no admite rangos
+        command = f"tail -c +{offset + 1} {shlex.quote(self.remote_path)}"
+        with self.client.open_service(self.serial, f"exec:{command}") as sock:
+            while True:
+                data = sock.recv(SyncConnection.DATA_MAX)
+                if not data:
+                    return
+                target.write(data)
+                if self.progress:
+                    self.progress.add(len(data))
+
+class FolderSync:
+    """Sincronización incremental entre una carpeta local y una del dispositivo
+    
+    Compara tamaño y mtime (los SEND conservan el mtime local) y transfiere
+    solo lo nuevo o cambiado. Con checksum, los archivos de igual tamaño y
+    distinto mtime se comparan con md5sum en el dispositivo antes de copiarse.
+    El estado remoto tras cada subida se guarda en un manifiesto JSON por
+    dispositivo, así la siguiente comparación no necesita recorrer el remoto.
+    """
+    
+    CHECKSUM_BATCH = 50  # Archivos por llamada a md5sum
+    
+    def __init__(self, serial, local_root, remote_root, checksum=False, mirror=False,
+                 use_manifest=True, progress=None):
+        self.serial = serial
+        self.local_root = local_root
+        self.remote_root = remote_root.rstrip('/') or '/'
+        self.checksum = checksum
+        self.mirror = mirror
+        self.use_manifest = use_manifest
+        self.progress = progress
+        self.client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+    
+    # --- Listados ---
+    def local_tree(self):
+        """{ruta relativa: (tamaño, mtime)} de la carpeta local"""
+        tree = {}
+        for dirpath, _, filenames in os.walk(self.local_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                relative = os.path.relpath(path, self.local_root).replace(os.sep, '/')
+                tree[relative] = (stat.st_size, int(stat.st_mtime))
+        return tree
+    
+    def remote_tree(self, sync):
+        """{ruta relativa: (tamaño, mtime)} de la carpeta remota recorrida con LIST"""
+        tree = {}
+        folders = [""]
+        while folders:
+            folder = folders.pop()
+            for name, mode, size, mtime in sync.list(self.remote_path(folder)):
+                relative = f"{folder}/{name}" if folder else name
+                if mode & 0o170000 == 0o040000:
+                    folders.append(relative)
+                elif mode & 0o170000 == 0o100000:
+                    tree[relative] = (size, mtime)
+        return tree
+    
+    def remote_path(self, relative):
+        if not relative:
+            return self.remote_root
+        return f"{self.remote_root.rstrip('/')}/{relative}"
+    
+    def local_path(self, relative):
+        return os.path.join(self.local_root, *relative.split('/'))
+    
+    # --- Manifiesto ---
+    def manifest_path(self):
+        return os.path.join(MANIFEST_DIR, re.sub(r'[^A-Za-z0-9._-]', '_', self.serial) + ".json")
+    
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_manifest(self, tree):
+        manifest = self.load_manifest()
+        manifest[self.remote_root] = {relative: list(meta) for relative, meta in tree.items()}
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        temp_path = self.manifest_path() + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path())
+    
+    # --- Comparación ---
+    def remote_checksums(self, relatives):
+        """{ruta relativa: md5} calculado en el dispositivo"""
+        sums = {}
+        for index in range(0, len(relatives), self.CHECKSUM_BATCH):
+            batch = relatives[index:index + self.CHECKSUM_BATCH]
+            paths = " ".join(shlex.quote(self.remote_path(relative)) for relative in batch)
+            _, output, _ = self.client.shell(self.serial, f"md5sum {paths} 2>/dev/null")
+            by_path = {}
+            for line in output.splitlines():
+                digest, _, path = line.strip().partition("  ")
+                by_path[path] = digest
+            for relative in batch:
+                if self.remote_path(relative) in by_path:
+                    sums[relative] = by_path[self.remote_path(relative)]
+        return sums
+    
+    def local_checksum(self, relative):
+        digest = hashlib.md5()
+        with open(self.local_path(relative), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def changed(self, source, target):
+        """Rutas de source que faltan en target o difieren en tamaño/mtime"""
+        changed = [relative for relative, meta in source.items() if tuple(target.get(relative, ())) != tuple(meta)]
+        if not self.checksum:
+            return changed
+        
+        # Mismo tamaño pero distinto mtime: decidir por contenido
+        suspects = [relative for relative in changed
+                    if relative in target and target[relative][0] == source[relative][0]]
+        remote = self.remote_checksums(suspects) if suspects else {}
+        same = {relative for relative in suspects
+                if remote.get(relative) == self.local_checksum(relative)}
+        return [relative for relative in changed if relative not in same]
+    
+    # --- Operaciones ---
+    def push(self):
+        """Subir lo nuevo o cambiado; devuelve (enviados, omitidos, borrados, errores)"""
+        local = self.local_tree()
+        remote = self.load_manifest().get(self.remote_root) if self.use_manifest else None
+        if remote is None:
+            with self.client.open_sync(self.serial) as sync:
+                remote = self.remote_tree(sync)
+        remote = {relative: tuple(meta) for relative, meta in remote.items()}
+        
+        changed = self.changed(local, remote)
+        if self.progress:
+            self.progress.add_total(sum(local[relative][0] for relative in changed))
+        entries = [(self.local_path(relative), self.remote_path(relative)) for relative in changed]
+        results = TreePush(self.serial, entries, self.progress).run()
+        errors = {}
+        for relative in changed:
+            error = results.get(self.remote_path(relative))
+            if error:
+                errors[relative] = error
+            else:
+                remote[relative] = local[relative]
+        for relative in set(local) - set(changed):
+            remote[relative] = local[relative]  # Iguales por contenido: adoptar el mtime local
+        copied = len(changed) - len(errors)  # Antes de sumar los fallos de borrado
+        
+        deleted = 0
+        extra = sorted(set(remote) - set(local))
+        if self.mirror and extra:
+            for index in range(0, len(extra), self.CHECKSUM_BATCH):
+                batch = extra[index:index + self.CHECKSUM_BATCH]
+                paths = " ".join(shlex.quote(self.remote_path(relative)) for relative in batch)
+                code, output, _ = self.client.shell(self.serial, f"rm -f {paths}")
+                if code == 0:
+                    deleted += len(batch)
+                    for relative in batch:
+                        del remote[relative]
+                else:
+                    errors.update({relative: output.strip() or "rm falló" for relative in batch})
+        
+        self.save_manifest(remote)
+        return copied, len(local) - len(changed), deleted, errors
+    
+    def pull(self):
+        """Bajar lo nuevo o cambiado; devuelve (recibidos, omitidos, borrados, errores)"""
+        local = self.local_tree() if os.path.isdir(self.local_root) else {}
+        errors = {}
+        sync = self.client.open_sync(self.serial)
+        try:
+            remote = self.remote_tree(sync)
+            changed = self.changed(remote, local)
+            if self.progress:
+                self.progress.add_total(sum(remote[relative][0] for relative in changed))
+            for relative in changed:
+                path = self.local_path(relative)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    with open(path, 'wb') as target:
+                        sync.recv(self.remote_path(relative), target,
+                                  self.progress.add if self.progress else None)
+                except ADBError as e:
+                    # El dispositivo cierra la sesión tras un FAIL: abrir otra
+                    os.remove(path)
+                    errors[relative] = str(e)
+                    sync.close()
+                    sync = self.client.open_sync(self.serial)
+                    continue
+                except OSError:
+                    os.remove(path)
+                    raise
+                mtime = remote[relative][1]
+                os.utime(path, (mtime, mtime))  # Igualar mtime para la próxima comparación
+        finally:
+            sync.close()
+        
+        for relative in set(remote) - set(changed):
+            mtime = remote[relative][1]
+            if local[relative][1] != mtime:  # Iguales por contenido
+                os.utime(self.local_path(relative), (mtime, mtime))
+        copied = len(changed) - len(errors)  # Antes de sumar los fallos de borrado
+        
+        deleted = 0
+        if self.mirror:
+            for relative in sorted(set(local) - set(remote)):
+                try:
+                    os.remove(self.local_path(relative))
+                    deleted += 1
+                except OSError as e:
+                    errors[relative] = str(e)
+        
+        self.save_manifest(remote)
+        return copied, len(remote) - len(changed), deleted, errors
+
+class TarPull:
+    """Descarga de una carpeta como un único flujo tar
+    
+    El dispositivo ejecuta 'tar -c' por exec: y las entradas se extraen según
+    llegan (tarfile en modo 'r|'), sin archivo temporal en ningún lado ni una
+    ida y vuelta por archivo. Solo se extraen carpetas y archivos normales
+    cuya ruta quede dentro del destino; enlaces y dispositivos se omiten.
+    """
+    
+    def __init__(self, serial, remote_dir, local_dir, progress=None):
+        self.serial = serial
+        self.remote_dir = remote_dir.rstrip('/') or '/'
+        self.local_dir = local_dir
+        self.progress = progress
+        self.client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+    
+    def estimate_size(self):
+        """Tamaño aproximado de la carpeta (du -sk) para la barra de progreso"""
+        try:
+            code, output, _ = self.client.shell(self.serial, f"du -sk {shlex.quote(self.remote_dir)}")
+            return int(output.split()[0]) * 1024 if code == 0 else 0
+        except (OSError, ADBError, ValueError, IndexError):
+            return 0
+    
+    def target_path(self, name):
+        """Ruta local de una entrada, o None si saldría del destino"""
+        root = os.path.realpath(self.local_dir)
+        path = os.path.realpath(os.path.join(root, *name.split('/')))
+        if os.path.isabs(name) or (path != root and not path.startswith(root + os.sep)):
+            return None
+        return path
+    
+    def run(self):
+        """Descargar y extraer; devuelve (archivos, bytes, omitidos)"""
+        with self.client.open_sync(self.serial) as sync:
+            mode, _, _ = sync.stat(self.remote_dir)
+        if mode & 0o170000 != 0o040000:
+            raise ADBError(f"No es una carpeta: {self.remote_dir}")
+        if self.progress:
+            self.progress.add_total(self.estimate_size())
+        
+        parent, name = posixpath.split(self.remote_dir)
+        command = f"tar -cf - -C {shlex.quote(parent or '/')} {shlex.quote(name or '.')} 2>/dev/null"
+        files = written = skipped = 0
+        with self.client.open_service(self.serial, f"exec:{command}") as sock, \
+                sock.makefile('rb') as stream:
+            try:
+                archive = tarfile.open(fileobj=stream, mode='r|')
+            except tarfile.ReadError:
+                raise ADBError("El dispositivo no devolvió un archivo tar (¿sin permisos?)")
+            with archive:
+                for member in archive:
+                    path = self.target_path(member.name)
+                    if path is None or not (member.isdir() or member.isfile()):
+                        skipped += 1
+                        continue
+                    if member.isdir():
+                        os.makedirs(path, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    source = archive.extractfile(member)
+                    with open(path, 'wb') as target:
+                        for block in iter(lambda: source.read(SyncConnection.DATA_MAX), b""):
+                            target.write(block)
+                            if self.progress:
+                                self.progress.add(len(block))
+                    os.utime(path, (member.mtime, member.mtime))
+                    files += 1
+                    written += member.size
+                    if self.progress:
+                        self.progress.add(0, entries=1)
+        return files, written, skipped
+
+class CompressionPolicy:
+    """Elección del códec de compresión por tipo de archivo
+    
+    Los tipos ya comprimidos nunca se comprimen. Para el resto se guarda la
+    velocidad efectiva (bytes originales/s, media móvil) con y sin compresión
+    por extensión y se elige la más rápida; mientras falte una de las dos
+    medidas se prueba la que falta.
+    """
+    
+    SMOOTHING = 0.3  # Peso de la última medida en la media móvil
+    EXPLORE = 0.1  # Probabilidad de volver a medir la opción descartada
+    MIN_SIZE = 256 * 1024  # Por debajo la compresión no compensa el arranque del proceso
+    
+    def __init__(self, path=TRANSFER_STATS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.rates = json.load(f)
+        except (OSError, ValueError):
+            self.rates = {}
+    
+    @staticmethod
+    def _key(path):
+        return os.path.splitext(path)[1].lower() or "(sin extensión)"
+    
+    def codec_for(self, path, size, codecs):
+        """Códec a usar (de los soportados, por preferencia) o None"""
+        codec = next((codec for codec in COMPRESSION_CODECS if codec in codecs), None)
+        if codec is None or size < self.MIN_SIZE or self._key(path) in INCOMPRESSIBLE_EXTENSIONS:
+            return None
+        with self.lock:
+            rates = self.rates.get(self._key(path), {})
+        if "none" not in rates or codec not in rates:
+            return codec if codec not in rates else None
+        faster = rates[codec] >= rates["none"]
+        if random.random() < self.EXPLORE:
+            faster = not faster  # Las condiciones cambian (USB/Wi-Fi, CPU del dispositivo)
+        return codec if faster else None
+    
+    def record(self, path, codec, size, seconds):
+        """Registrar la velocidad de una transferencia terminada"""
+        if seconds <= 0 or size < self.MIN_SIZE:
+            return
+        with self.lock:
+            rates = self.rates.setdefault(self._key(path), {})
+            name = codec or "none"
+            rate = size / seconds
+            rates[name] = rate if name not in rates else (
+                self.SMOOTHING * rate + (1 - self.SMOOTHING) * rates[name])
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self.rates, f)
+            except OSError:
+                pass  # Las estadísticas son solo una optimización
+
+def run_adb_transfer(serial, direction, codec, source, target, measure, size, progress=None):
+    """'adb push/pull -z <códec>' con el ejecutable (el cliente nativo solo habla sync v1)
+    
+    adb no informa del progreso por una tubería, así que cada segundo se
+    consulta measure() (bytes ya escritos en el destino): lo que avanza va a
+    `progress` y si no cambia en TRANSFER_STALL_TIMEOUT segundos se aborta
+    con socket.timeout, igual que las transferencias sync. Cualquier cambio
+    cuenta como avance, también un valor menor (un tamaño de 32 bits que da
+    la vuelta al pasar de 4 GiB).
+    """
+    process = subprocess.Popen([get_adb_path(), "-s", serial, direction, "-z", codec, source, target],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                               creationflags=SUBPROCESS_FLAGS)
+    output = []
+    reader = threading.Thread(target=lambda: output.append(process.stdout.read()), daemon=True)
+    reader.start()
+    done = measured = 0
+    last_change = time.monotonic()
+    while True:
+        try:
+            process.wait(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            current = measure()
+        except (OSError, ADBError):
+            current = measured
+        if current != measured:
+            measured = current
+            last_change = time.monotonic()
+            if current > done:
+                if progress:
+                    progress.add(current - done)
+                done = current
+        elif time.monotonic() - last_change > TRANSFER_STALL_TIMEOUT:
+            process.kill()
+            process.wait()
+            raise socket.timeout(f"adb {direction} sin progreso")
+    reader.join(timeout=5)
+    if process.returncode != 0:
+        raise ADBError("".join(output).strip() or f"adb {direction} falló")
+    if progress and size > done:
+        progress.add(size - done)
+
+def parse_raw_frame(data):
+    """(ancho, alto, formato, píxeles) de la salida de 'screencap' sin -p
+    
+    La cabecera tiene ancho, alto y formato (y el espacio de color desde
+    Android 9), todos de 32 bits little-endian.
+    """
+    if len(data) < 12:
+        raise ADBError("screencap no devolvió ningún fotograma")
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    if pixel_format not in RAW_FORMATS:
+        raise ADBError(f"Formato de píxel no soportado: {pixel_format}")
+    header = len(data) - width * height * RAW_FORMATS[pixel_format][1]
+    if header not in (12, 16):
+        raise ADBError("Tamaño de fotograma inesperado")
+    return width, height, RAW_FORMATS[pixel_format][0], memoryview(data)[header:]
+
+def encode_png(width, height, mode, pixels, level=BURST_PNG_LEVEL):
+    """PNG de 8 bits RGB/RGBA solo con zlib"""
+    bpp = len(mode)
+    if mode == "BGRA":
+        swapped = bytearray(pixels)
+        swapped[0::4], swapped[2::4] = pixels[2::4], pixels[0::4]
+        pixels = swapped
+    elif mode == "RGBX":  # El cuarto byte no es alfa: opaco
+        opaque = bytearray(pixels)
+        opaque[3::4] = b"\xff" * (width * height)
+        pixels = opaque
+    stride = width * bpp
+    rows = b"".join(b"\x00" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+    
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+    
+    color_type = 2 if bpp == 3 else 6
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, level))
+            + chunk(b"IEND", b""))
+
+def encode_frame(path, width, height, mode, pixels, image_format):
+    """Codificar y guardar un fotograma (se ejecuta en el pool de procesos)"""
+    if image_format == "webp":
+        image = Image.frombuffer("RGBA" if mode in ("RGBA", "BGRA") else "RGB", (width, height),
+                                 pixels, "raw", mode, 0, 1)
+        image.save(path, "WEBP", quality=90, method=0)
+    else:
+        with open(path, 'wb') as f:
+            f.write(encode_png(width, height, mode, pixels))
+    return path
+
+class BurstCapture:
+    """Capturas seguidas de un dispositivo en bruto, codificadas en el PC
+    
+    Cada fotograma se pide con 'screencap' sin -p (el dispositivo no codifica
+    nada), se descarta si es idéntico al anterior (crc32) y se manda a un
+    pool de procesos que lo guarda como PNG o WebP con su marca de tiempo.
+    """
+    
+    def __init__(self, serial, directory, encoder, fps=BURST_FPS, image_format="png",
+                 stop=None, cancelled=None):
+        self.serial = serial
+        self.directory = directory
+        self.encoder = encoder
+        self.interval = 1.0 / max(fps, 1)
+        self.image_format = image_format
+        self.stop = stop or threading.Event()
+        self.cancelled = cancelled or (lambda: False)
+        self.client = ADBClient()
+        self.prefix = re.sub(r'[^A-Za-z0-9_.-]', '_', serial)
+    
+    def frame_path(self, captured):
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(captured))
+        millis = int(captured * 1000) % 1000
+        return os.path.join(self.directory, f"{self.prefix}_{stamp}_{millis:03d}.{self.image_format}")
+    
+    def run(self):
+        """Capturar hasta que se pida parar; devuelve (guardados, repetidos)"""
+        os.makedirs(self.directory, exist_ok=True)
+        pending = collections.deque()
+        saved = repeated = 0
+        previous = None
+        try:
+            while not self.stop.is_set() and not self.cancelled():
+                started = time.monotonic()
+                captured = time.time()
+                width, height, mode, pixels = parse_raw_frame(
+                    self.client.exec_out(self.serial, "screencap", timeout=10))
+                digest = zlib.crc32(pixels)
+                if digest == previous:
+                    repeated += 1
+                else:
+                    previous = digest
+                    while len(pending) >= BURST_MAX_PENDING:  # Codificación más lenta que la captura
+                        pending.popleft().result()
+                        saved += 1
+                    pending.append(self.encoder.submit(
+                        encode_frame, self.frame_path(captured), width, height, mode,
+                        bytes(pixels), self.image_format))
+                self.stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            for future in pending:
+                future.result()
+                saved += 1
+        return saved, repeated
+
+class ScreenPreview:
+    """Vista previa en vivo a partir de 'screenrecord --output-format=h264'
+    
+    Un hilo lee el flujo por exec:, lo decodifica con PyAV y deja en una
+    única ranura el último fotograma ya escalado como PPM. Si Tk no lo ha
+    recogido cuando llega el siguiente, se sustituye (se descarta), así la
+    memoria no crece y la latencia no se acumula. Cuando screenrecord llega
+    a su límite de tiempo se vuelve a lanzar.
+    """
+    
+    def __init__(self, serial, on_error=None):
+        self.serial = serial
+        self.on_error = on_error or (lambda message: None)
+        self.size = (360, 640)  # Tamaño del panel; lo actualiza la ventana
+        self.latest = None
+        self.shown = self.dropped = 0
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.sock = None
+    
+    def start(self):
+        self.running.set()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def stop(self):
+        self.running.clear()
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # Desbloquear el recv del hilo
+            except OSError:
+                pass
+    
+    def take(self):
+        """Último fotograma (ancho, alto, PPM) pendiente de mostrar, o None"""
+        with self.lock:
+            frame, self.latest = self.latest, None
+            if frame:
+                self.shown += 1
+        return frame
+    
+    def _run(self):
+        command = f"screenrecord --output-format=h264 --bit-rate {PREVIEW_BIT_RATE} -"
+        while self.running.is_set():
+            try:
+                # Con la pantalla quieta screenrecord no envía nada: sin plazo de lectura
+                self.sock = ADBClient().open_stream(self.serial, f"exec:{command}")
+                codec = av.CodecContext.create("h264", "r")
+                decoded = 0
+                with self.sock:
+                    while self.running.is_set():
+                        data = self.sock.recv(65536)
+                        if not data:
+                            break  # Límite de screenrecord: volver a lanzarlo
+                        for packet in codec.parse(data):
+                            for frame in codec.decode(packet):
+                                self._publish(frame)
+                                decoded += 1
+                if decoded == 0 and self.running.is_set():
+                    raise ADBError("screenrecord no envió vídeo")
+            except Exception as e:
+                if self.running.is_set():
+                    self.on_error(str(e))
+                    self.running.clear()
+            finally:
+                self.sock = None
+    
+    def _publish(self, frame):
+        """Escalar al panel conservando la proporción y dejarlo en la ranura"""
+        pane_width, pane_height = self.size
+        scale = min(pane_width / frame.width, pane_height / frame.height)
+        width = max(2, int(frame.width * scale)) & ~1
+        height = max(2, int(frame.height * scale)) & ~1
+        plane = frame.reformat(width=width, height=height, format="rgb24").planes[0]
+        row = width * 3
+        if plane.line_size == row:
+            pixels = bytes(plane)
+        else:
+            buffer = memoryview(plane)
+            pixels = b"".join(buffer[y * plane.line_size:y * plane.line_size + row]
+                              for y in range(height))
+        ppm = b"P6\n%d %d\n255\n" % (width, height) + pixels
+        with self.lock:
+            if self.latest is not None:
+                self.dropped += 1
+            self.latest = (width, height, ppm)
+
+class SegmentedRecorder:
+    """Grabación de pantalla sin el límite de 3 minutos de screenrecord
+    
+    Graba segmentos MP4 seguidos en el dispositivo. Cada uno se descarga y se
+    borra en segundo plano mientras se graba el siguiente, así que el
+    dispositivo nunca guarda más de dos. Al parar, screenrecord recibe
+    SIGINT para que cierre bien el MP4. Opcionalmente los segmentos se unen
+    con ffmpeg (concat sin recodificar) si está instalado.
+    """
+    
+    def __init__(self, serial, directory, join=False, log=None, cancelled=None,
+                 segment_seconds=RECORD_SEGMENT_SECONDS):
+        self.serial = serial
+        self.directory = directory
+        self.join = join
+        self.log = log or (lambda message: None)
+        self.cancelled = cancelled or (lambda: False)
+        self.segment_seconds = segment_seconds
+        self.stopping = threading.Event()
+        self.client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+        self.token = uuid.uuid4().hex[:8]  # Identifica los segmentos de esta grabación
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        self.prefix = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', serial)}_{stamp}"
+    
+    def remote_segment(self, index):
+        return f"{RECORD_REMOTE_DIR}/adbm_rec_{self.token}_{index:03d}.mp4"
+    
+    def process_pattern(self, name):
+        """Patrón de pkill/pgrep -f que solo casa con el propio screenrecord
+        
+        Anclado al principio de la línea de comandos para no casar con el
+        'sh -c' que lo lanza ni con el de pkill/pgrep.
+        """
+        return shlex.quote(f"^[^ ]*screenrecord .*{name}")
+    
+    def stop(self):
+        """Terminar el segmento en curso (SIGINT) y no empezar otro
+        
+        Se puede llamar desde el hilo de Tk: el SIGINT sale de un hilo propio,
+        no del pool de tareas (puede estar lleno de grabaciones).
+        """
+        self.stopping.set()
+        threading.Thread(target=self._interrupt, daemon=True).start()
+    
+    def _interrupt(self):
+        try:
+            pattern = self.process_pattern(f"adbm_rec_{self.token}_")
+            self.client.shell(self.serial, f"pkill -INT -f {pattern}")
+        except (OSError, ADBError) as e:
+            self.log(f"⚠️ No se pudo detener screenrecord en {self.serial}: {e}")
+    
+    def wait_closed(self, remote):
+        """Esperar a que screenrecord termine y el segmento deje de crecer
+        
+        Tras un SIGINT screenrecord aún escribe el índice del MP4; descargarlo
+        antes dejaría un archivo corrupto.
+        """
+        command = (f"pgrep -f {self.process_pattern(posixpath.basename(remote))} >/dev/null"
+                   f" || stat -c %s {shlex.quote(remote)}")
+        deadline = time.monotonic() + RECORD_CLOSE_TIMEOUT
+        last = None
+        while time.monotonic() < deadline:
+            _, output, _ = self.client.shell(self.serial, command)
+            size = output.strip()
+            if size.isdigit() and size == last:
+                return
+            last = size if size.isdigit() else None
+            time.sleep(0.5)
+        self.log(f"⚠️ {remote} sigue abierto en {self.serial} tras {RECORD_CLOSE_TIMEOUT}s")
+    
+    def fetch(self, remote, local):
+        """Descargar un segmento terminado y, si ha llegado entero, borrarlo del dispositivo"""
+        try:
+            self.wait_closed(remote)
+            with self.client.open_sync(self.serial) as sync, open(local, 'wb') as target:
+                sync.recv(remote, target)
+        except (OSError, ADBError) as e:
+            self.log(f"⚠️ Segmento conservado en el dispositivo ({remote}): {e}")
+            raise
+        self.client.shell(self.serial, f"rm -f {shlex.quote(remote)}")
+        self.log(f"🎬 Segmento guardado: {os.path.basename(local)}")
+        return local
+    
+    def run(self):
+        """Grabar hasta que se pare; devuelve (segmentos locales, archivo unido o None)"""
+        os.makedirs(self.directory, exist_ok=True)
+        downloads = []
+        with ThreadPoolExecutor(max_workers=1) as pulls:
+            index = 0
+            while not self.stopping.is_set() and not self.cancelled():
+                remote = self.remote_segment(index)
+                code, output, _ = self.client.shell(
+                    self.serial, f"screenrecord --time-limit {self.segment_seconds} {shlex.quote(remote)}",
+                    timeout=self.segment_seconds + 30)
+                if code not in (0, 130, 2):  # 130/2: terminado con SIGINT
+                    self.client.shell(self.serial, f"rm -f {shlex.quote(remote)}")
+                    raise ADBError(output.strip() or f"screenrecord terminó con código {code}")
+                local = os.path.join(self.directory, f"{self.prefix}_{index:03d}.mp4")
+                downloads.append(pulls.submit(self.fetch, remote, local))
+                index += 1
+        segments = [download.result() for download in downloads]
+        
+        if not self.join or len(segments) < 2:
+            return segments, None
+        return segments, self.join_segments(segments)
+    
+    def join_segments(self, segments):
+        """Unir los MP4 con el demuxer concat de ffmpeg; None si no hay ffmpeg"""
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            self.log("⚠️ ffmpeg no está instalado: se conservan los segmentos por separado")
+            return None
+        list_path = os.path.join(self.directory, f"{self.prefix}_segmentos.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment in segments:
+                f.write(f"file '{os.path.abspath(segment)}'\n")
+        output = os.path.join(self.directory, f"{self.prefix}.mp4")
+        try:
+            result = subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                                     "-i", list_path, "-c", "copy", output],
+                                    capture_output=True, text=True, creationflags=SUBPROCESS_FLAGS)
+        finally:
+            os.remove(list_path)
+        if result.returncode != 0:
+            raise ADBError(f"ffmpeg no pudo unir los segmentos: {result.stderr.strip()}")
+        for segment in segments:
+            os.remove(segment)
+        return output
+
+def format_size(size):
+    """Tamaño legible: 1.5 MB, 820 KB..."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+# ========== SESIONES SHELL PERSISTENTES ==========
+class ShellSession:
+    """Sesión 'adb shell' de larga duración para un dispositivo
+    
+    Los comandos se escriben en stdin y su salida se separa con un marcador
+    único seguido del código de salida, evitando lanzar un proceso por comando.
+    """
+    
+    END_MARKER = "__ADBM_END__"
+    
+    def __init__(self, serial):
+        self.serial = serial
+        self.lock = threading.Lock()
+        self.process = None
+        self.lines = None
+        self.last_used = 0.0
+    
+    def start(self):
+        """Lanzar el proceso shell y el hilo lector"""
+        self.process = subprocess.Popen([get_adb_path(), "-s", self.serial, "shell"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        creationflags=SUBPROCESS_FLAGS)
+        self.lines = queue.Queue()
+        threading.Thread(target=self._reader, args=(self.process, self.lines),
+                         daemon=True).start()
+        # Sin eco por si el dispositivo asigna un PTY (shell v1)
+        self._write("stty -echo 2>/dev/null\n")
+        self.run("true", timeout=10)
+    
+    @staticmethod
+    def _reader(process, lines):
+        for line in iter(process.stdout.readline, b""):
+            lines.put(line)
+        lines.put(None)  # Fin del proceso
+    
+    def _write(self, text):
+        self.process.stdin.write(text.encode('utf-8'))
+        self.process.stdin.flush()
+    
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+    
+    def run(self, command, timeout=SHELL_SESSION_TIMEOUT):
+        """Ejecutar comando y devolver (código, salida, "")"""
+        with self.lock:
+            token = f"{self.END_MARKER}{uuid.uuid4().hex}:"
+            # Subshell: un 'exit' del comando no cierra la sesión
+            self._write(f"( {command}\n) </dev/null 2>&1\nprintf '\\n%s%s\\n' '{token}' \"$?\"\n")
+            
+            deadline = time.monotonic() + timeout
+            output = []
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    raw = self.lines.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    # La salida quedaría desincronizada: descartar la sesión
+                    self.close()
+                    raise TimeoutError(f"Timeout en la sesión shell de {self.serial}")
+                if raw is None:
+                    raise ConnectionError(f"La sesión shell de {self.serial} terminó")
+                
+                line = raw.decode('utf-8', 'replace').replace('\r\n', '\n')
+                if line.startswith(token):
+                    self.last_used = time.monotonic()
+                    text = "".join(output)
+                    if text.endswith("\n"):
+                        text = text[:-1]  # Salto añadido por el marcador
+                    try:
+                        code = int(line[len(token):].strip())
+                    except ValueError:
+                        code = -1
+                    return code, text, ""
+                output.append(line)
+    
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+            self.process = None
+
+class ShellSessionPool:
+    """Pool de sesiones shell persistentes, una por dispositivo"""
+    
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+    
+    def _get(self, serial):
+        with self.lock:
+            session = self.sessions.get(serial)
+            if session is None or not session.is_alive():
+                session = ShellSession(serial)
+                self.sessions[serial] = session
+                new = True
+            else:
+                new = False
+        
+        # Una sesión que no contesta al arrancar o a la comprobación tras un
+        # rato inactiva está colgada: se trata como muerta
+        try:
+            if new:
+                session.start()
+            elif time.monotonic() - session.last_used > SHELL_HEALTH_INTERVAL:
+                session.run("true", timeout=5)
+        except TimeoutError:
+            raise ConnectionError(f"La sesión shell de {serial} no responde")
+        return session
+    
+    def run(self, serial, command, timeout=SHELL_SESSION_TIMEOUT):
+        """Ejecutar comando en la sesión del dispositivo, reiniciándola si murió.
+        
+        Solo el propio comando devuelve Timeout; una sesión que no pasa la
+        comprobación se cierra y se abre otra. Devuelve None si no se pudo
+        abrir ninguna sesión.
+        """
+        for _ in range(2):
+            try:
+                return self._get(serial).run(command, timeout)
+            except TimeoutError:
+                return -1, "", "Timeout"
+            except (OSError, ConnectionError):
+                self.close(serial)
+        return None
+    
+    def close(self, serial):
+        with self.lock:
+            session = self.sessions.pop(serial, None)
+        if session:
+            session.close()
+    
+    def close_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+class StreamingCommand:
+    """Proceso de la consola cuya salida se lee a medida que se produce
+    
+    Un hilo lector deja los fragmentos en una cola que la interfaz vacía por
+    lotes; no hay timeout, el proceso vive hasta que termina o se detiene.
+    """
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, command):
+        self.command = command
+        self.chunks = queue.Queue()
+        self.returncode = None
+        self.process = None
+    
+    def start(self):
+        """Lanzar el proceso y el hilo lector"""
+        shell = command_uses_shell(self.command)
+        if shell or platform.system() == "Windows":
+            args = self.command  # CreateProcess interpreta la cadena tal cual
+        else:
+            args = shlex.split(self.command)
+        if platform.system() == "Windows":
+            options = {"creationflags": SUBPROCESS_FLAGS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            options = {"start_new_session": True}  # Grupo propio para poder detenerlo entero
+        self.process = subprocess.Popen(args, shell=shell, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        **options)
+        threading.Thread(target=self._reader, daemon=True).start()
+    
+    def _reader(self):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        stream = self.process.stdout
+        while True:
+            data = stream.read1(self.CHUNK_SIZE)
+            if not data:
+                break
+            self.chunks.put(decoder.decode(data))
+        self.chunks.put(decoder.decode(b"", final=True))
+        self.returncode = self.process.wait()
+    
+    @property
+    def finished(self):
+        return self.returncode is not None
+    
+    def drain(self):
+        """Texto acumulado desde la última llamada"""
+        return drain_queue(self.chunks)
+    
+    def write(self, line):
+        """Enviar una línea a stdin del proceso (p. ej. 'adb shell' interactivo)"""
+        self.process.stdin.write((line + "\n").encode('utf-8'))
+        self.process.stdin.flush()
+    
+    def stop(self):
+        """Terminar el proceso y sus hijos (shell=True lanza un intérprete intermedio)"""
+        if self.process is None or self.process.poll() is not None:
+            return
+        try:
+            if platform.system() == "Windows":
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(self.process.pid)],
+                               capture_output=True, creationflags=SUBPROCESS_FLAGS)
+            else:
+                os.killpg(self.process.pid, signal.SIGTERM)
+        except OSError:
+            self.process.kill()
+
+def drain_queue(pending):
+    """Vaciar una cola de fragmentos de texto y devolverlos unidos"""
+    parts = []
+    while True:
+        try:
+            parts.append(pending.get_nowait())
+        except queue.Empty:
+            return "".join(parts)
+
+def command_uses_shell(command):
+    """True si el comando necesita el intérprete local (tuberías, redirecciones...)"""
+    return bool(re.search(r'[|&;<>`$]', command))
+
+# ========== SEGUIMIENTO DE DISPOSITIVOS ==========
+@dataclass
+class DeviceEntry:
+    """Fila de la tabla de dispositivos del servidor ADB"""
+    serial: str
+    state: str
+    transport_id: str = ""
+    model: str = ""
+    product: str = ""
+    connection: str = "USB"  # "USB" o "TCP"
+
+DEVICE_ATTRIBUTES = ("usb", "product", "model", "device", "transport_id")
+
+def parse_device_list(text):
+    """Convertir la salida de 'devices -l' en {serial: DeviceEntry}"""
+    devices = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or line.startswith("List of devices"):
+            continue
+        
+        serial = parts[0]
+        # El estado puede tener espacios ("no permissions ...") antes de los atributos
+        state_parts = []
+        attrs = {}
+        for part in parts[1:]:
+            key, sep, value = part.partition(':')
+            if sep and key in DEVICE_ATTRIBUTES:
+                attrs[key] = value
+            elif not attrs:
+                state_parts.append(part)
+        
+        tcp = ':' in serial or '._tcp' in serial
+        devices[serial] = DeviceEntry(
+            serial=serial,
+            state=" ".join(state_parts),
+            transport_id=attrs.get("transport_id", ""),
+            model=attrs.get("model", ""),
+            product=attrs.get("product", ""),
+            connection="TCP" if tcp else "USB",
+        )
+    return devices
+
+class DeviceTracker:
+    """Hilo suscrito a 'host:track-devices-l' que mantiene la tabla de dispositivos
+    
+    El servidor envía la lista completa en cada cambio; se calcula la diferencia
+    y se notifica on_change(añadidos, eliminados, cambiados, inicial).
+    """
+    
+    def __init__(self, client, on_change):
+        self.client = client
+        self.on_change = on_change
+        self.devices = {}
+        self.synced = False  # True cuando la tabla refleja el estado del servidor
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sock = None
+    
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+    
+    def snapshot(self):
+        with self.lock:
+            return dict(self.devices)
+    
+    def _apply(self, new_devices, initial):
+        with self.lock:
+            old_devices = self.devices
+            self.devices = new_devices
+            self.synced = True
+        
+        added = [d for s, d in new_devices.items() if s not in old_devices]
+        removed = [d for s, d in old_devices.items() if s not in new_devices]
+        changed = [d for s, d in new_devices.items()
+                   if s in old_devices and old_devices[s] != d]
+        if added or removed or changed or initial:
+            self.on_change(added, removed, changed, initial)
+    
+    def _run(self):
+        delay = 0.5
+        while not self.stop_event.is_set():
+            try:
+                self.sock = self.client.open_host_stream("host:track-devices-l")
+                delay = 0.5
+                initial = True
+                while not self.stop_event.is_set():
+                    self._apply(parse_device_list(self.client.read_message(self.sock)), initial)
+                    initial = False
+            except socket.timeout:
+                # Sin respuesta no significa servidor caído: resuscribirse sin vaciar la tabla
+                self.stop_event.wait(delay)
+                continue
+            except (OSError, ADBError, ValueError):
+                pass
+            finally:
+                if self.sock:
+                    self.sock.close()
+                    self.sock = None
+            
+            # Servidor caído: vaciar la tabla y reintentar con espera creciente
+            with self.lock:
+                self.synced = False
+            if self.devices:
+                self._apply({}, False)
+                with self.lock:
+                    self.synced = False
+            self.stop_event.wait(delay)
+            delay = min(delay * 2, 5)
+
+# ========== ESCÁNER DE RED ==========
+# Mensajes del protocolo de transporte ADB (cabecera de 6 enteros little-endian)
+A_CNXN = 0x4E584E43
+A_AUTH = 0x48545541
+A_STLS = 0x534C5453
+A_VERSION = 0x01000001
+ADB_MAX_PAYLOAD = 256 * 1024
+
+def adb_message(command, arg0, arg1, payload=b""):
+    """Construir un mensaje ADB: cabecera + payload"""
+    checksum = sum(payload) & 0xFFFFFFFF
+    return struct.pack("<6I", command, arg0, arg1, len(payload), checksum,
+                       command ^ 0xFFFFFFFF) + payload
+
+class NetworkScanner:
+    """Escáner TCP asíncrono: conexiones no bloqueantes a muchos hosts a la vez
+    
+    Un host se considera activo si responde al intento de conexión, ya sea
+    aceptándola (puerto abierto) o rechazándola (RST, puerto cerrado).
+    Con confirm=True los puertos abiertos se validan con un handshake CNXN
+    de ADB y solo se marcan como ADB si el otro extremo responde como adbd.
+    """
+    
+    OPEN = "open"
+    CLOSED = "closed"
+    ADB = "adb"
+    
+    BATCH_SIZE = 4096  # Sondeos creados por lote (acota la memoria en barridos grandes)
+    
+    def __init__(self, concurrency=SCAN_CONCURRENCY, timeout=SCAN_TIMEOUT, rate=SCAN_RATE,
+                 cancelled=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate = rate  # Conexiones nuevas por segundo como máximo
+        self.cancelled = cancelled or (lambda: False)  # Consultado entre resultados
+        self._next_slot = 0.0
+    
+    async def _throttle(self):
+        """Limitar el ritmo de conexiones nuevas a self.rate por segundo"""
+        if not self.rate:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    async def _handshake(self, reader, writer):
+        """Enviar CNXN y comprobar que la respuesta es un mensaje ADB válido"""
+        writer.write(adb_message(A_CNXN, A_VERSION, ADB_MAX_PAYLOAD, b"host::\0"))
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(24), self.timeout)
+        command, _, _, _, _, magic = struct.unpack("<6I", header)
+        return command in (A_CNXN, A_AUTH, A_STLS) and magic == command ^ 0xFFFFFFFF
+    
+    async def _probe(self, host, port, semaphore, confirm):
+        async with semaphore:
+            await self._throttle()
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port),
+                                                        self.timeout)
+            except ConnectionRefusedError:
+                return host, port, self.CLOSED
+            except (asyncio.TimeoutError, OSError):
+                return host, port, None
+            
+            state = self.OPEN
+            if confirm:
+                try:
+                    if await self._handshake(reader, writer):
+                        state = self.ADB
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError):
+                    pass
+            writer.close()
+            return host, port, state
+    
+    async def _scan(self, targets, on_result, confirm):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._next_slot = 0.0
+        results = []
+        for index in range(0, len(targets), self.BATCH_SIZE):
+            batch = targets[index:index + self.BATCH_SIZE]
+            tasks = [asyncio.ensure_future(self._probe(host, port, semaphore, confirm))
+                     for host, port in batch]
+            for future in asyncio.as_completed(tasks):
+                host, port, state = await future
+                if state:
+                    results.append((host, port, state))
+                if on_result:
+                    on_result(host, port, state)
+                if self.cancelled():
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    return results
+        return results
+    
+    def scan(self, hosts, ports=(ADB_TCP_PORT,), on_result=None, confirm=False):
+        """Sondear todos los (host, puerto); on_result(host, puerto, estado) por cada
+        resultado según llega. Devuelve [(host, puerto, estado)] de los que respondieron.
+        """
+        targets = [(host, port) for host in hosts for port in ports]
+        return asyncio.run(self._scan(targets, on_result, confirm))
+    
+    def discover_adb_ports(self, hosts, port_range=WIRELESS_PORT_RANGE, on_result=None):
+        """Barrer un rango de puertos en los hosts dados y devolver solo los
+        extremos confirmados como ADB [(host, puerto)]
+        """
+        first, last = port_range
+        results = self.scan(hosts, range(first, last + 1), on_result, confirm=True)
+        return [(host, port) for host, port, state in results if state == self.ADB]
+
+# ========== DESCUBRIMIENTO mDNS ==========
+@dataclass
+class MdnsService:
+    """Servicio ADB anunciado por mDNS"""
+    name: str
+    service: str  # ADB_CONNECT_SERVICE o ADB_PAIRING_SERVICE
+    ip: str
+    port: int
+    expires: float
+
+DNS_TYPE_A = 1
+DNS_TYPE_PTR = 12
+DNS_TYPE_TXT = 16
+DNS_TYPE_SRV = 33
+
+def build_mdns_query(names):
+    """Consulta DNS con una pregunta PTR por cada nombre de servicio"""
+    packet = struct.pack("!6H", 0, 0, len(names), 0, 0, 0)
+    for name in names:
+        for label in name.rstrip('.').split('.'):
+            packet += bytes([len(label)]) + label.encode('utf-8')
+        packet += b"\0" + struct.pack("!2H", DNS_TYPE_PTR, 1)
+    return packet
+
+def _read_dns_name(data, offset):
+    """Leer nombre DNS (con punteros de compresión); devuelve (nombre, offset siguiente)"""
+    labels = []
+    end = None
+    for _ in range(128):  # Evitar bucles de punteros maliciosos
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('utf-8', 'replace'))
+        offset += length
+    return ".".join(labels), (end if end is not None else offset)
+
+def parse_mdns_records(data):
+    """Extraer registros (nombre, tipo, ttl, valor) de las respuestas de un paquete DNS"""
+    _, _, qdcount, ancount, nscount, arcount = struct.unpack("!6H", data[:12])
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_dns_name(data, offset)
+        offset += 4
+    
+    records = []
+    for _ in range(ancount + nscount + arcount):
+        name, offset = _read_dns_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata_offset = offset
+        offset += rdlength
+        
+        if rtype == DNS_TYPE_PTR:
+            value = _read_dns_name(data, rdata_offset)[0]
+        elif rtype == DNS_TYPE_SRV:
+            _, _, port = struct.unpack("!3H", data[rdata_offset:rdata_offset + 6])
+            value = (_read_dns_name(data, rdata_offset + 6)[0], port)
+        elif rtype == DNS_TYPE_A and rdlength == 4:
+            value = socket.inet_ntoa(data[rdata_offset:offset])
+        else:
+            continue
+        records.append((name.lower(), rtype, ttl, value))
+    return records
+
+class MdnsDiscovery:
+    """Escucha anuncios mDNS de _adb-tls-connect/_adb-tls-pairing y mantiene
+    una caché de servicios que caduca según el TTL de cada registro
+    
+    El grupo y el puerto son configurables para poder probarlo con un
+    respondedor local.
+    """
+    
+    SERVICES = (ADB_CONNECT_SERVICE, ADB_PAIRING_SERVICE)
+    
+    def __init__(self, on_change=None, group=MDNS_GROUP, port=MDNS_PORT,
+                 query_interval=MDNS_QUERY_INTERVAL):
+        self.on_change = on_change
+        self.group = group
+        self.port = port
+        self.query_interval = query_interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sock = None
+        # Cachés por tipo de registro: clave -> (valor, caducidad)
+        self.ptr = {}  # (servicio, instancia) -> True
+        self.srv = {}  # instancia -> (host, puerto)
+        self.addresses = {}  # host -> ip
+        self.adb_services = {}  # Resultados de 'adb mdns services': (servicio, nombre) -> MdnsService
+    
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("", self.port))
+            membership = struct.pack("4s4s", socket.inet_aton(self.group),
+                                     socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except OSError:
+            # Puerto 5353 ocupado: consultas "legacy" con respuesta unicast
+            sock.close()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.bind(("", 0))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        sock.settimeout(1.0)
+        return sock
+    
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def query(self):
+        """Enviar consulta PTR de los servicios ADB"""
+        if self.sock:
+            try:
+                self.sock.sendto(build_mdns_query([f"{name}.local" for name in self.SERVICES]),
+                                 (self.group, self.port))
+            except OSError:
+                pass
+    
+    def _run(self):
+        try:
+            self.sock = self._open_socket()
+        except OSError:
+            return
+        
+        next_query = 0.0
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_query:
+                self.query()
+                next_query = now + self.query_interval
+            try:
+                data, _ = self.sock.recvfrom(9000)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                records = parse_mdns_records(data)
+            except (struct.error, IndexError):
+                continue
+            if records and self._store(records) and self.on_change:
+                self.on_change()
+        self.sock.close()
+    
+    def _store(self, records):
+        """Guardar registros en caché; devuelve True si cambió algún servicio ADB"""
+        now = time.monotonic()
+        changed = False
+        with self.lock:
+            for name, rtype, ttl, value in records:
+                expires = now + ttl
+                if rtype == DNS_TYPE_PTR:
+                    service = name.rsplit(".local", 1)[0]
+                    if service in self.SERVICES:
+                        key = (service, value)
+                        if ttl == 0:
+                            changed |= self.ptr.pop(key, None) is not None
+                        else:
+                            changed |= key not in self.ptr
+                            self.ptr[key] = expires
+                elif rtype == DNS_TYPE_SRV:
+                    changed |= self.srv.get(name, (None,))[0] != value
+                    self.srv[name] = (value, expires)
+                elif rtype == DNS_TYPE_A:
+                    changed |= self.addresses.get(name, (None,))[0] != value
+                    self.addresses[name] = (value, expires)
+        return changed
+    
+    def refresh_from_adb(self, output):
+        """Incorporar la salida de 'adb mdns services' (alternativa a escuchar mDNS)"""
+        expires = time.monotonic() + 120
+        found = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) < 3 or ':' not in parts[-1]:
+                continue
+            service = parts[1].rstrip('.')
+            if service not in self.SERVICES:
+                continue
+            ip, _, port = parts[-1].rpartition(':')
+            if port.isdigit():
+                found[(service, parts[0])] = MdnsService(parts[0], service, ip, int(port), expires)
+        with self.lock:
+            self.adb_services = found
+    
+    def services(self, service=None):
+        """Servicios vigentes (opcionalmente de un solo tipo)"""
+        now = time.monotonic()
+        result = {}
+        with self.lock:
+            for (kind, instance), expires in list(self.ptr.items()):
+                if expires <= now:
+                    del self.ptr[(kind, instance)]
+                    continue
+                srv = self.srv.get(instance.lower())
+                if not srv or srv[1] <= now:
+                    continue
+                (host, port), _ = srv
+                address = self.addresses.get(host.lower())
+                if not address or address[1] <= now:
+                    continue
+                name = instance.split('.')[0]
+                result[(kind, name)] = MdnsService(name, kind, address[0], port, expires)
+            for key, entry in self.adb_services.items():
+                if entry.expires > now:
+                    result.setdefault(key, entry)
+        return [entry for entry in result.values() if service is None or entry.service == service]
+
+# ========== BUFFERS DE TEXTO ==========
+class TextRing:
+    """Buffer circular de líneas que respalda un widget de texto
+    
+    Guarda hasta `capacity` líneas (las más antiguas se descartan en O(1)) y
+    el widget solo conserva las últimas `visible`; guardar y copiar leen del
+    buffer, no del widget.
+    """
+    
+    def __init__(self, capacity, visible=WIDGET_VISIBLE_LINES):
+        self.lines = collections.deque(maxlen=capacity)
+        self.partial = ""  # Última línea aún sin salto de línea
+        self.visible = visible
+        self.shown = 0  # Líneas completas presentes en el widget
+    
+    def append(self, text):
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        self.lines.extend(line + "\n" for line in lines)
+    
+    def text(self):
+        return "".join(self.lines) + self.partial
+    
+    def clear(self):
+        self.lines.clear()
+        self.partial = ""
+        self.shown = 0
+    
+    def write(self, widget, text):
+        """Añadir texto al buffer y al widget, recortando el principio del widget"""
+        self.append(text)
+        count = text.count("\n")
+        if count > self.visible:
+            # El lote ya llena el widget: insertar solo sus últimas líneas
+            text = "\n".join(text.split("\n")[-(self.visible + 1):])
+            widget.delete("1.0", tk.END)
+            self.shown = 0
+            count = self.visible
+        widget.insert(tk.END, text)
+        self.shown += count
+        # Recortar por bloques para no borrar en cada inserción
+        excess = self.shown - self.visible
+        if excess > self.visible // 10:
+            widget.delete("1.0", f"{excess + 1}.0")
+            self.shown -= excess
+        widget.see(tk.END)
+
+# ========== TAREAS EN SEGUNDO PLANO ==========
+PRIORITY_INTERACTIVE = 0  # Consola: adelanta a todo lo demás
+PRIORITY_NORMAL = 1  # Operaciones lanzadas desde botones
+PRIORITY_BACKGROUND = 2  # Escaneos y descubrimiento
+
+@dataclass
+class Job:
+    """Tarea encolada o en ejecución en el JobPool"""
+    id: int
+    name: str
+    func: object
+    args: tuple
+    priority: int = PRIORITY_NORMAL
+    serial: str = None
+    key: object = None
+    started: float = None
+    cancelled: bool = False
+    on_cancel: object = None  # Se llama si se cancela antes de empezar
+
+class JobPool:
+    """Pool acotado de hilos con prioridades y serialización por dispositivo
+    
+    Como mucho `workers` tareas a la vez; el resto espera ordenado por
+    (prioridad, llegada). Dos tareas del mismo serial nunca corren en
+    paralelo y una tarea con `key` no se encola si ya hay otra igual.
+    """
+    
+    IDLE_TIMEOUT = 30  # Segundos sin trabajo antes de liberar un hilo
+    
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.pending = []
+        self.running = {}
+        self.busy_serials = set()
+        self.threads = 0
+        self.idle = 0
+        self.next_id = 1
+        self.local = threading.local()
+        self.cond = threading.Condition()
+    
+    def submit(self, name, func, *args, priority=PRIORITY_NORMAL, serial=None, key=None,
+               on_cancel=None):
+        """Encolar func(*args); devuelve el Job o None si es un duplicado
+        
+        on_cancel() se llama si la tarea se cancela sin haber empezado, para
+        que quien espera su resultado no se quede esperando.
+        """
+        with self.cond:
+            if key is not None and any(job.key == key for job in self.jobs()):
+                return None
+            job = Job(self.next_id, name, func, args, priority, serial, key, on_cancel=on_cancel)
+            self.next_id += 1
+            self.pending.append(job)
+            if len(self.pending) > self.idle and self.threads < self.workers:
+                self.threads += 1
+                threading.Thread(target=self._work, daemon=True).start()
+            self.cond.notify()
+        return job
+    
+    def jobs(self):
+        """Tareas en ejecución seguidas de las pendientes"""
+        with self.cond:
+            return list(self.running.values()) + sorted(self.pending, key=self._order)
+    
+    def cancel(self, job_id):
+        """Quitar una tarea pendiente o marcar como cancelada una en ejecución"""
+        with self.cond:
+            for job in self.pending:
+                if job.id == job_id:
+                    self.pending.remove(job)
+                    break
+            else:
+                job = self.running.get(job_id)
+                if job is None:
+                    return False
+                job.cancelled = True
+                return True
+        if job.on_cancel:
+            job.on_cancel()
+        return True
+    
+    def cancelled(self):
+        """True si la tarea del hilo actual se ha cancelado"""
+        job = getattr(self.local, "job", None)
+        return job is not None and job.cancelled
+    
+    def shutdown(self):
+        with self.cond:
+            self.pending.clear()
+            for job in self.running.values():
+                job.cancelled = True
+    
+    @staticmethod
+    def _order(job):
+        return job.priority, job.id
+    
+    def _next(self):
+        """Tarea pendiente de mayor prioridad cuyo dispositivo está libre"""
+        runnable = [job for job in self.pending if job.serial not in self.busy_serials]
+        return min(runnable, key=self._order) if runnable else None
+    
+    def _work(self):
+        while True:
+            with self.cond:
+                self.idle += 1
+                job = self._next()
+                while job is None:
+                    if not self.cond.wait(timeout=self.IDLE_TIMEOUT) and self._next() is None:
+                        self.idle -= 1
+                        self.threads -= 1
+                        return
+                    job = self._next()
+                self.idle -= 1
+                self.pending.remove(job)
+                if job.serial is not None:
+                    self.busy_serials.add(job.serial)
+                job.started = time.monotonic()
+                self.running[job.id] = job
+            
+            self.local.job = job
+            try:
+                job.func(*job.args)
+            except Exception:
+                pass  # Cada operación informa de sus propios errores
+            self.local.job = None
+            
+            with self.cond:
+                del self.running[job.id]
+                self.busy_serials.discard(job.serial)
+                self.cond.notify_all()  # Puede haber liberado un dispositivo
+
+# ========== SESIONES DE DISPOSITIVO ==========
+class DeviceSession:
+    """Sesión de trabajo con un dispositivo: estado y cola de comandos propia
+    
+    Las operaciones enviadas con submit() pasan por el JobPool ligadas al
+    serial, de modo que dos acciones sobre el mismo teléfono no se pisan
+    y dispositivos distintos trabajan en paralelo.
+    """
+    
+    def __init__(self, serial, pool):
+        self.serial = serial
+        self.state = "offline"
+        self.model = ""
+        self.connection = "USB"
+        self.lock = threading.Lock()
+        self.pool = pool
+    
+    @property
+    def ready(self):
+        return self.state == "device"
+    
+    def update(self, entry):
+        with self.lock:
+            self.state = entry.state
+            self.model = entry.model
+            self.connection = entry.connection
+    
+    def label(self):
+        model = f" ({self.model})" if self.model else ""
+        return f"{self.serial}{model} [{self.state}, {self.connection}]"
+    
+    def submit(self, name, func, *args, priority=PRIORITY_NORMAL, key=None, on_cancel=None):
+        """Encolar func(*args) en el pool, serializada con el resto del dispositivo"""
+        return self.pool.submit(f"{name} [{self.serial}]", func, *args, priority=priority,
+                                serial=self.serial, key=key, on_cancel=on_cancel)
+
+class DeviceRegistry:
+    """Registro de sesiones de dispositivo indexadas por número de serie"""
+    
+    def __init__(self, pool):
+        self.sessions = {}
+        self.pool = pool
+        self.lock = threading.Lock()
+    
+    def sync(self, table):
+        """Actualizar sesiones con la tabla de dispositivos; devuelve los seriales eliminados"""
+        with self.lock:
+            for serial, entry in table.items():
+                session = self.sessions.get(serial)
+                if session is None:
+                    session = self.sessions[serial] = DeviceSession(serial, self.pool)
+                session.update(entry)
+            removed = [serial for serial in self.sessions if serial not in table]
+            for serial in removed:
+                del self.sessions[serial]
+        return removed
+    
+    def get(self, serial):
+        """Sesión del dispositivo (se crea si aún no la conoce el registro)"""
+        with self.lock:
+            session = self.sessions.get(serial)
+            if session is None:
+                session = self.sessions[serial] = DeviceSession(serial, self.pool)
+            return session
+    
+    def all(self):
+        with self.lock:
+            return sorted(self.sessions.values(), key=lambda session: session.serial)
+    
+    def ready_serials(self):
+        return [session.serial for session in self.all() if session.ready]
+
+# ========== LOGCAT ==========
+LOGCAT_THREADTIME_RE = re.compile(
+    r'^(\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\s+(\d+)\s+(\d+) ([VDIWEFS]) (.*?)\s*: (.*)$')
+
+def parse_threadtime(line):
+    """(hora, pid, tid, nivel, tag, mensaje) de una línea 'logcat -v threadtime', o None"""
+    match = LOGCAT_THREADTIME_RE.match(line.rstrip('\r'))
+    if match is None:
+        return None  # Cabeceras '--------- beginning of ...'
+    time_text, pid, tid, level, tag, message = match.groups()
+    return (time_text, int(pid), int(tid), level, tag, message)
+
+class BinaryLogcatParser:
+    """Decodificador incremental de 'logcat -B'
+    
+    Cada entrada es una cabecera logger_entry (len, hdr_size, pid, tid, sec,
+    nsec; v1 sin hdr_size ocupa 20 bytes) seguida de prioridad, tag y
+    mensaje terminados en NUL. Se lee con struct sin expresiones regulares;
+    los tags se comparten entre registros y la hora (en milisegundos) y el
+    mensaje (en bytes) no se formatean hasta que se pintan, así el buffer
+    ocupa poco. Los registros tienen la misma forma que los de
+    parse_threadtime.
+    """
+    
+    HEADER = struct.Struct("<HHiiiI")
+    PRIORITIES = "VVVDIWEFS"  # Índice = android_LogPriority
+    
+    def __init__(self):
+        self.pending = b""
+        self.tags = {}  # Prioridad + tag en bruto -> (nivel, tag)
+    
+    def feed(self, data):
+        """Registros completos contenidos en lo recibido hasta ahora"""
+        buffer = self.pending + data if self.pending else data
+        unpack_from = self.HEADER.unpack_from
+        find = buffer.find
+        tags = self.tags
+        end = len(buffer)
+        offset = 0
+        records = []
+        append = records.append
+        while end - offset >= 20:
+            length, header_size, pid, tid, sec, nsec = unpack_from(buffer, offset)
+            start = offset + (header_size or 20)
+            stop = start + length
+            if stop > end:
+                break
+            offset = stop
+            tag_end = find(b"\0", start + 1, stop)
+            if tag_end == -1:
+                continue  # Entrada vacía o sin tag
+            raw_tag = buffer[start:tag_end]
+            tag = tags.get(raw_tag)
+            if tag is None:
+                level = self.PRIORITIES[raw_tag[0]] if raw_tag[0] < 9 else 'V'
+                tag = tags[raw_tag] = (level, raw_tag[1:].decode('utf-8', 'replace'))
+            # Hora en milisegundos y mensaje en bytes: se formatean solo al pintarse
+            millis = sec * 1000 + nsec // 1000000
+            message = buffer[tag_end + 1:stop - 1 if buffer[stop - 1] == 0 else stop]
+            if b"\n" in message:  # Como en texto: un registro por línea
+                for line in message.rstrip(b"\n").split(b"\n"):
+                    append((millis, pid, tid, tag[0], tag[1], line))
+            else:
+                append((millis, pid, tid, tag[0], tag[1], message))
+        self.pending = buffer[offset:]
+        return records
+
+def benchmark_logcat(count=200000):
+    """Comparar el parseo de logcat en texto (threadtime) y en binario (-B)"""
+    entries = []
+    lines = []
+    for i in range(count):
+        pid, tid, sec, nsec = 1000 + i % 50, 2000 + i % 200, 1760000000 + i // 5000, (i % 1000) * 1000000
+        level, tag = "VDIWEF"[i % 6], f"Tag{i % 40}"
+        message = f"mensaje de prueba número {i} con algo de texto".encode()
+        payload = bytes([BinaryLogcatParser.PRIORITIES.index(level)]) + tag.encode() + b"\0" + message + b"\0"
+        entries.append(BinaryLogcatParser.HEADER.pack(len(payload), 20, pid, tid, sec, nsec) + payload)
+        time_text = time.strftime("%m-%d %H:%M:%S", time.localtime(sec)) + f".{nsec // 1000000:03d}"
+        lines.append(f"{time_text} {pid:5} {tid:5} {level} {tag}: {message.decode()}")
+    text = ("\n".join(lines) + "\n").encode()
+    binary = b"".join(entries)
+    chunk = 65536  # Lo que entrega cada recv del socket
+    
+    def parse_text():
+        partial = ""
+        records = []
+        for index in range(0, len(text), chunk):
+            split = (partial + text[index:index + chunk].decode('utf-8', 'replace')).split("\n")
+            partial = split.pop()
+            records += [record for record in map(parse_threadtime, split) if record]
+        return records
+    
+    def parse_binary():
+        parser = BinaryLogcatParser()
+        records = []
+        for index in range(0, len(binary), chunk):
+            records += parser.feed(binary[index:index + chunk])
+        return records
+    
+    def best_of(parse, rounds=3):
+        """Mejor tiempo de varias rondas sin el recolector de basura (como timeit)"""
+        timings = []
+        for _ in range(rounds):
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                records = len(parse())
+                timings.append(time.perf_counter() - started)
+            finally:
+                gc.enable()
+        return records, min(timings)
+    
+    text_records, text_seconds = best_of(parse_text)
+    binary_records, binary_seconds = best_of(parse_binary)
+    
+    print(f"Texto (threadtime): {text_records} registros en {text_seconds:.3f}s "
+          f"({text_records / text_seconds:,.0f}/s, {format_size(len(text))})")
+    print(f"Binario (-B):       {binary_records} registros en {binary_seconds:.3f}s "
+          f"({binary_records / binary_seconds:,.0f}/s, {format_size(len(binary))})")
+    print(f"Binario {text_seconds / binary_seconds:.1f}x más rápido")
+
+def format_record(record):
+    time_text, pid, tid, level, tag, message = record
+    if isinstance(message, bytes):  # Registros de logcat -B
+        seconds, millis = divmod(time_text, 1000)
+        time_text = time.strftime("%m-%d %H:%M:%S", time.localtime(seconds)) + f".{millis:03d}"
+        message = message.decode('utf-8', 'replace')
+    return f"{time_text} {pid:5} {tid:5} {level} {tag}: {message}\n"
+
+class LogcatStream:
+    """Lectura continua de logcat de un dispositivo por exec:
+    
+    El hilo lector parsea las líneas y deja los registros en una cola
+    acotada; si Tk no la vacía a tiempo se descartan los más antiguos.
+    """
+    
+    def __init__(self, serial, capacity=LOGCAT_BUFFER_RECORDS, binary=LOGCAT_BINARY):
+        self.serial = serial
+        self.binary = binary
+        self.pending = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.error = None
+        self.sock = None
+    
+    def start(self):
+        self.running.set()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def stop(self):
+        self.running.clear()
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def take(self):
+        """Registros llegados desde la última llamada"""
+        with self.lock:
+            records = list(self.pending)
+            self.pending.clear()
+        return records
+    
+    def _run(self):
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        parser = BinaryLogcatParser()
+        partial = ""
+        output = "-B" if self.binary else "-v threadtime"
+        try:
+            # Un buffer tranquilo puede pasar mucho sin líneas: sin plazo de lectura
+            self.sock = ADBClient().open_stream(
+                self.serial, f"exec:logcat {output} -T {LOGCAT_BACKLOG}")
+            with self.sock:
+                while self.running.is_set():
+                    data = self.sock.recv(65536)
+                    if not data:
+                        break
+                    if self.binary:
+                        records = parser.feed(data)
+                    else:
+                        lines = (partial + decoder.decode(data)).split("\n")
+                        partial = lines.pop()
+                        records = [record for record in map(parse_threadtime, lines) if record]
+                    with self.lock:
+                        self.pending.extend(records)
+        except (OSError, ADBError) as e:
+            if self.running.is_set():
+                self.error = str(e)
+        finally:
+            self.sock = None
+            self.running.clear()
+
+class LogcatViewer:
+    """Ventana de logcat en vivo con filtros por tag, pid y nivel
+    
+    Los registros ya parseados se guardan en un buffer circular; cambiar un
+    filtro solo recorre ese buffer (sin volver a parsear) hasta llenar las
+    líneas visibles. Las líneas nuevas que pasan el filtro se pintan en un
+    único insert por volcado, con una etiqueta de color por nivel.
+    """
+    
+    def __init__(self, app, serial):
+        self.app = app
+        self.serial = serial
+        self.records = collections.deque(maxlen=LOGCAT_BUFFER_RECORDS)
+        self.stream = LogcatStream(serial)
+        self.shown = 0
+        self.filter_job = None
+        self.min_level = 0
+        self.pid = None
+        self.tag = ""
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title(f"Logcat - {serial}")
+        self.window.configure(bg='#34495e')
+        self.window.geometry("1000x600")
+        
+        filter_frame = tk.Frame(self.window, bg='#34495e')
+        filter_frame.pack(fill='x', padx=10, pady=5)
+        self.tag_var = tk.StringVar()
+        self.pid_var = tk.StringVar()
+        self.level_var = tk.StringVar(value='V')
+        self.paused = tk.BooleanVar(value=False)
+        for label, var, width in (("Tag:", self.tag_var, 20), ("PID:", self.pid_var, 8)):
+            tk.Label(filter_frame, text=label, fg='#ecf0f1', bg='#34495e',
+                    font=('Arial', 9)).pack(side='left')
+            tk.Entry(filter_frame, textvariable=var, width=width,
+                    font=('Consolas', 9)).pack(side='left', padx=(2, 10))
+        tk.Label(filter_frame, text="Nivel:", fg='#ecf0f1', bg='#34495e',
+                font=('Arial', 9)).pack(side='left')
+        tk.OptionMenu(filter_frame, self.level_var, *LOGCAT_LEVELS).pack(side='left', padx=(2, 10))
+        tk.Checkbutton(filter_frame, text="⏸️ Pausa", variable=self.paused,
+                      command=self.apply_filter, fg='#ecf0f1', bg='#34495e',
+                      selectcolor='#2c3e50', activebackground='#34495e',
+                      font=('Arial', 9)).pack(side='left')
+        tk.Button(filter_frame, text="🧹 Limpiar", command=self.clear,
+                 bg='#e74c3c', fg='white', font=('Arial', 9),
+                 relief='flat', padx=10).pack(side='left', padx=5)
+        self.status_label = tk.Label(filter_frame, text="", fg='#95a5a6', bg='#34495e',
+                                     font=('Consolas', 9))
+        self.status_label.pack(side='right')
+        
+        self.text = scrolledtext.ScrolledText(self.window, bg='#1e1e1e', fg='#ecf0f1',
+                                              font=('Consolas', 9), wrap='none')
+        self.text.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        for level, color in LOGCAT_COLORS.items():
+            self.text.tag_configure(level, foreground=color)
+        
+        for var in (self.tag_var, self.pid_var, self.level_var):
+            var.trace_add('write', self.schedule_filter)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.stream.start()
+        self.pump()
+    
+    def matches(self, record):
+        return (LOGCAT_LEVELS.find(record[3]) >= self.min_level
+                and (self.pid is None or record[1] == self.pid)
+                and (not self.tag or self.tag in record[4].lower()))
+    
+    def schedule_filter(self, *args):
+        """Aplicar el filtro cuando se deje de teclear"""
+        if self.filter_job:
+            self.app.root.after_cancel(self.filter_job)
+        self.filter_job = self.app.root.after(LOGCAT_FILTER_DELAY_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        """Repintar las últimas líneas del buffer que pasan el filtro"""
+        self.filter_job = None
+        self.min_level = LOGCAT_LEVELS.find(self.level_var.get())
+        pid = self.pid_var.get().strip()
+        self.pid = int(pid) if pid.isdigit() else None
+        self.tag = self.tag_var.get().strip().lower()
+        
+        matched = []
+        for record in reversed(self.records):
+            if self.matches(record):
+                matched.append(record)
+                if len(matched) == LOGCAT_VISIBLE_LINES:
+                    break
+        self.text.delete("1.0", tk.END)
+        self.shown = 0
+        self.render(matched[::-1])
+    
+    def render(self, records):
+        """Pintar registros con un único insert y recortar el principio por bloques"""
+        if not records:
+            return
+        chunks = []
+        for record in records[-LOGCAT_VISIBLE_LINES:]:
+            chunks += (format_record(record), record[3])
+        self.text.insert(tk.END, *chunks)
+        self.shown += min(len(records), LOGCAT_VISIBLE_LINES)
+        excess = self.shown - LOGCAT_VISIBLE_LINES
+        if excess > LOGCAT_VISIBLE_LINES // 10:
+            self.text.delete("1.0", f"{excess + 1}.0")
+            self.shown -= excess
+        self.text.see(tk.END)
+    
+    def pump(self):
+        """Recoger lo llegado y pintar lo que pasa el filtro (hilo de Tk)"""
+        if not self.window.winfo_exists():
+            return
+        records = self.stream.take()
+        if records:
+            self.records.extend(records)
+            if not self.paused.get():
+                self.render([record for record in records if self.matches(record)])
+        state = "en vivo" if self.stream.running.is_set() else f"detenido {self.stream.error or ''}"
+        self.status_label.config(text=f"{len(self.records)} registros · {state}")
+        self.app.root.after(UI_FLUSH_MS, self.pump)
+    
+    def clear(self):
+        self.records.clear()
+        self.text.delete("1.0", tk.END)
+        self.shown = 0
+    
+    def close(self):
+        self.stream.stop()
+        self.app.logcat_viewers.pop(self.serial, None)
+        self.window.destroy()
+
 class ADBFileManagerFixed:
     def __init__(self, root):
         self.root = root
@@ -59,10 +2751,59 @@ class ADBFileManagerFixed:
         self.device_port = tk.StringVar()
         self.pairing_code = tk.StringVar()
         self.selected_file = tk.StringVar()
-        self.target_device = None  # Dispositivo específico conectado
+        self.selected_files = []  # [(ruta local, ruta relativa en destino)] a enviar
+        self.jobs = JobPool()  # Todas las tareas en segundo plano
+        self.registry = DeviceRegistry(self.jobs)  # Sesiones de todos los dispositivos
+        self.target_mode = tk.StringVar(value="selected")  # "selected" o "all"
+        self.listed_serials = []  # Seriales en el orden de la lista de dispositivos
+        self.adb_client = ADBClient()  # Cliente nativo del servidor ADB
+        self.shell_pool = ShellSessionPool()  # Sesiones shell persistentes por dispositivo
+        self.device_tracker = DeviceTracker(
+            self.adb_client,
+            lambda *diff: self.root.after(0, self.on_devices_changed, *diff))
+        self.mdns = MdnsDiscovery(on_change=lambda: self.root.after(0, self.on_mdns_changed))
+        self.mdns_seen = set()
+        self.group_outputs = tk.BooleanVar(value=False)
+        self.stream = None  # Proceso en streaming de la consola
+        self.burst_stop = None  # Evento para detener la ráfaga de capturas en curso
+        self.encoder = None  # Pool de procesos que codifica las capturas en ráfaga
+        self.preview = None  # Vista previa en vivo abierta
+        self.recorders = []  # Grabaciones de pantalla en curso
+        self.logcat_viewers = {}  # Visores de logcat abiertos por dispositivo
+        self.compression = CompressionPolicy()  # Códec por tipo de archivo según velocidades medidas
+        self.device_codecs = {}  # Códecs de compresión soportados por servidor y dispositivo
+        self.console_buffer = TextRing(CONSOLE_BUFFER_LINES)
+        self.log_buffer = TextRing(LOG_BUFFER_LINES)
+        self.log_queue = queue.SimpleQueue()  # Mensajes de cualquier hilo hacia el log
+        self.console_queue = queue.SimpleQueue()  # Texto de cualquier hilo hacia la consola
         
         self.setup_ui()
+        self.flush_output()
         self.check_adb()
+        self.device_tracker.start()
+        self.mdns.start()
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def on_close(self):
+        """Cerrar sesiones abiertas y salir"""
+        self.device_tracker.stop()
+        self.mdns.stop()
+        self.shell_pool.close_all()
+        if self.stream:
+            self.stream.stop()
+        if self.burst_stop:
+            self.burst_stop.set()
+        if self.preview:
+            self.preview.stop()
+        for recorder in self.recorders:
+            recorder.stopping.set()
+        for viewer in list(self.logcat_viewers.values()):
+            viewer.stream.stop()
+        if self.encoder:
+            self.encoder.shutdown(wait=False, cancel_futures=True)
+        self.jobs.shutdown()
+        self.root.destroy()
         
     def setup_ui(self):
         """Configurar la interfaz de usuario"""
@@ -85,6 +2826,9 @@ class ADBFileManagerFixed:
         # Frame de consola ADB (NUEVO)
         self.create_console_frame()
         
+        # Tareas en curso
+        self.create_jobs_frame()
+        
         # Log
         self.create_log_frame()
         
@@ -150,6 +2894,11 @@ class ADBFileManagerFixed:
                                 relief='flat', padx=15)
         self.usb_btn.pack(side='left', padx=5)
         
+        tk.Button(btn_frame, text="📡 mDNS", 
+                 command=self.discover_mdns,
+                 bg='#16a085', fg='white', font=('Arial', 10, 'bold'),
+                 relief='flat', padx=15).pack(side='left', padx=5)
+        
         self.disconnect_btn = tk.Button(btn_frame, text="❌ Desconectar", 
                                        command=self.disconnect_clean,
                                        bg='#e74c3c', fg='white', font=('Arial', 10, 'bold'),
@@ -167,6 +2916,27 @@ class ADBFileManagerFixed:
                                     fg='#e74c3c', bg='#34495e', font=('Arial', 10, 'bold'))
         self.status_label.pack(side='right', padx=10)
         
+        # Lista de dispositivos en vivo (host:track-devices-l) y destino de las operaciones
+        devices_frame = tk.Frame(conn_frame, bg='#34495e')
+        devices_frame.pack(fill='x', padx=10, pady=2)
+        
+        self.device_listbox = tk.Listbox(devices_frame, height=4, selectmode='extended',
+                                        bg='#2c3e50', fg='#ecf0f1', font=('Consolas', 9),
+                                        exportselection=False)
+        self.device_listbox.pack(side='left', fill='x', expand=True)
+        self.device_listbox.bind('<<ListboxSelect>>', lambda e: self.update_target_label())
+        
+        target_frame = tk.Frame(devices_frame, bg='#34495e')
+        target_frame.pack(side='left', padx=10)
+        
+        tk.Label(target_frame, text="Destino:", fg='#ecf0f1', bg='#34495e',
+                font=('Arial', 9, 'bold')).pack(anchor='w')
+        for text, value in (("Selección", "selected"), ("Todos", "all")):
+            tk.Radiobutton(target_frame, text=text, variable=self.target_mode, value=value,
+                          command=self.update_target_label,
+                          fg='#ecf0f1', bg='#34495e', selectcolor='#2c3e50',
+                          activebackground='#34495e', font=('Arial', 9)).pack(anchor='w')
+        
         # Info de dispositivo
         self.device_info_label = tk.Label(conn_frame, text="Dispositivo: Ninguno", 
                                          fg='#95a5a6', bg='#34495e', font=('Arial', 9))
@@ -206,6 +2976,11 @@ class ADBFileManagerFixed:
                  bg='#9b59b6', fg='white', font=('Arial', 10, 'bold'),
                  relief='flat', padx=15).pack(side='left')
         
+        tk.Button(select_frame, text="📁 Carpeta", 
+                 command=self.select_folder,
+                 bg='#9b59b6', fg='white', font=('Arial', 10, 'bold'),
+                 relief='flat', padx=10).pack(side='left', padx=(5,0))
+        
         self.file_label = tk.Label(select_frame, text="Ningún archivo seleccionado", 
                                   fg='#bdc3c7', bg='#34495e', font=('Arial', 9))
         self.file_label.pack(side='left', padx=(10,0))
@@ -232,9 +3007,26 @@ class ADBFileManagerFixed:
                                  relief='flat', padx=15, state='disabled')
         self.pull_btn.pack(side='left', padx=5)
         
+        self.pull_dir_btn = tk.Button(action_frame, text="📦 Descargar Carpeta", 
+                                 command=self.pull_folder,
+                                 bg='#8e44ad', fg='white', font=('Arial', 10, 'bold'),
+                                 relief='flat', padx=15, state='disabled')
+        self.pull_dir_btn.pack(side='left', padx=5)
+        
+        self.sync_btn = tk.Button(action_frame, text="🔄 Sincronizar", 
+                                 command=self.open_sync_dialog,
+                                 bg='#16a085', fg='white', font=('Arial', 10, 'bold'),
+                                 relief='flat', padx=15, state='disabled')
+        self.sync_btn.pack(side='left', padx=5)
+        
         # Barra de progreso
         self.progress = ttk.Progressbar(action_frame, mode='indeterminate')
         self.progress.pack(side='right', padx=(10,0), fill='x', expand=True)
+        
+        # Bytes, velocidad y tiempo restante de la transferencia en curso
+        self.transfer_label = tk.Label(file_frame, text="", fg='#95a5a6', bg='#34495e',
+                                       font=('Consolas', 9))
+        self.transfer_label.pack(anchor='e', padx=10)
     
     def create_tools_frame(self):
         """Crear frame de herramientas"""
@@ -266,6 +3058,23 @@ class ADBFileManagerFixed:
                  bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
                  relief='flat', padx=10).pack(side='left', padx=2)
         
+        self.burst_btn = tk.Button(btn_frame, text="🎞️ Ráfaga", 
+                                  command=self.toggle_burst,
+                                  bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
+                                  relief='flat', padx=10)
+        self.burst_btn.pack(side='left', padx=2)
+        
+        tk.Button(btn_frame, text="📺 Vista Previa", 
+                 command=self.open_preview,
+                 bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
+                 relief='flat', padx=10).pack(side='left', padx=2)
+        
+        self.record_btn = tk.Button(btn_frame, text="🎬 Grabar", 
+                                   command=self.toggle_recording,
+                                   bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
+                                   relief='flat', padx=10)
+        self.record_btn.pack(side='left', padx=2)
+        
         tk.Button(btn_frame, text="🔄 Reiniciar ADB", 
                  command=self.restart_adb,
                  bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
@@ -275,6 +3084,12 @@ class ADBFileManagerFixed:
                  command=self.scan_network,
                  bg='#34495e', fg='white', font=('Arial', 9, 'bold'),
                  relief='flat', padx=10).pack(side='left', padx=2)
+        
+        # Modo de escaneo ampliado: puertos aleatorios de depuración inalámbrica
+        self.scan_wide_ports = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Puertos WiFi", variable=self.scan_wide_ports,
+                      fg='#ecf0f1', bg='#34495e', selectcolor='#2c3e50',
+                      activebackground='#34495e', font=('Arial', 9)).pack(side='left', padx=2)
     
     def create_console_frame(self):
         """Crear frame de consola ADB (NUEVO)"""
@@ -304,6 +3119,10 @@ class ADBFileManagerFixed:
                  bg='#27ae60', fg='white', font=('Arial', 10, 'bold'),
                  relief='flat', padx=15).pack(side='right')
         
+        tk.Checkbutton(input_frame, text="Agrupar iguales", variable=self.group_outputs,
+                      fg='#ecf0f1', bg='#34495e', selectcolor='#2c3e50',
+                      activebackground='#34495e', font=('Arial', 9)).pack(side='right', padx=5)
+        
         # Frame de comandos rápidos
         quick_frame = tk.Frame(console_frame, bg='#34495e')
         quick_frame.pack(fill='x', padx=10, pady=5)
@@ -325,7 +3144,7 @@ class ADBFileManagerFixed:
             ("ℹ️ info", "adb shell getprop ro.build.version.release"),
             ("🔄 reboot", "adb reboot"),
             ("🏠 shell", "adb shell"),
-            ("📊 logcat", "adb logcat -d"),
+            ("📊 logcat", "logcat"),
             
             # Fila 2 - Archivos
             ("🗂️ /sdcard", "adb shell ls -la /sdcard"),
@@ -395,6 +3214,12 @@ class ADBFileManagerFixed:
                  bg='#95a5a6', fg='white', font=('Arial', 9),
                  relief='flat', padx=10).pack(side='left', padx=2)
         
+        self.stop_button = tk.Button(console_btn_frame, text="⏹️ Detener", 
+                                    command=self.stop_stream, state='disabled',
+                                    bg='#e67e22', fg='white', font=('Arial', 9),
+                                    relief='flat', padx=10)
+        self.stop_button.pack(side='right', padx=2)
+        
         tk.Button(console_btn_frame, text="⚠️ Kill Logcat", 
                  command=self.kill_logcat,
                  bg='#e74c3c', fg='white', font=('Arial', 9),
@@ -404,14 +3229,39 @@ class ADBFileManagerFixed:
         """Establecer comando rápido en el campo de entrada"""
         if command == "clear":
             self.clear_command_output()
+        elif command == "logcat":
+            self.open_logcat()
         else:
             self.command_var.set(command)
             self.command_entry.focus()
     
+    def open_logcat(self):
+        """Abrir un visor de logcat en vivo por dispositivo elegido"""
+        targets = self.require_targets()
+        if not targets:
+            return
+        for serial in targets:
+            viewer = self.logcat_viewers.get(serial)
+            if viewer:
+                viewer.window.lift()
+            else:
+                self.logcat_viewers[serial] = LogcatViewer(self, serial)
+                self.log(f"📊 Logcat en vivo de {serial}")
+    
     def execute_custom_command(self):
         """Ejecutar comando ADB personalizado"""
         command = self.command_var.get().strip()
         
+        # Con un proceso en marcha (p. ej. 'adb shell') la línea va a su entrada
+        if self.stream and not self.stream.finished:
+            self.command_var.set("")
+            try:
+                self.stream.write(command)
+                self.show_command_output(f"> {command}\n")
+            except OSError as e:
+                self.show_command_output(f"❌ Error enviando entrada: {e}\n")
+            return
+        
         if not command:
             self.show_command_output("❌ Error: Comando vacío\n")
             return
@@ -420,48 +3270,142 @@ class ADBFileManagerFixed:
         if not command.startswith('adb'):
             command = f"adb {command}"
         
-        # Si hay dispositivo conectado y no especifica dispositivo, agregarlo
-        if self.target_device and '-s' not in command:
-            # Insertar -s después de 'adb'
-            parts = command.split(' ', 1)
-            if len(parts) == 2:
-                command = f"{parts[0]} -s \"{self.target_device}\" {parts[1]}"
+        # Si hay dispositivos destino y no especifica dispositivo, agregarlo
+        targets = self.get_targets() if '-s' not in command else []
+        
+        if len(targets) > 1:
+            self.fan_out_command(command, targets)
+        else:
+            if targets:
+                command = self.with_serial(command, targets[0])
+            self.start_stream(command)
         
+        # Limpiar campo de entrada
+        self.command_var.set("")
+    
+    def start_stream(self, command):
+        """Lanzar el comando mostrando su salida a medida que llega"""
         self.show_command_output(f"$ {command}\n")
+        adb_path = get_adb_path()
+        stream = StreamingCommand(command.replace('adb', f'"{adb_path}"', 1))
+        try:
+            stream.start()
+        except (OSError, ValueError) as e:
+            self.show_command_output(f"❌ Excepción: {e}\n\n")
+            return
+        self.stream = stream
+        self.stop_button.config(state='normal')
+        self.root.after(STREAM_FLUSH_MS, self.pump_stream, stream)
+    
+    def pump_stream(self, stream):
+        """Volcar por lotes la salida pendiente del proceso (hilo de Tk)"""
+        text = stream.drain()
+        if text:
+            self.show_command_output(text)
+        if not stream.finished:
+            self.root.after(STREAM_FLUSH_MS, self.pump_stream, stream)
+            return
+        
+        text = stream.drain()
+        if text:
+            self.show_command_output(text)
+        code = stream.returncode
+        if code == 0:
+            self.show_command_output("\n✅ Comando ejecutado exitosamente\n\n")
+        else:
+            self.show_command_output(f"\n❌ Error (código: {code})\n\n")
+        if self.stream is stream:
+            self.stream = None
+            self.stop_button.config(state='disabled')
+    
+    def stop_stream(self):
+        """Detener el proceso en curso de la consola"""
+        if self.stream and not self.stream.finished:
+            self.stream.stop()
+            self.show_command_output("\n⏹️ Detenido por el usuario\n")
+    
+    def fan_out_command(self, command, serials):
+        """Ejecutar el mismo comando en varios dispositivos a la vez.
         
-        def execute_thread():
+        Cada dispositivo es una tarea interactiva del JobPool (como mucho
+        JOB_WORKERS en paralelo); su salida se muestra al terminar y al final se resume el
+        código de salida y la duración de cada uno.
+        """
+        group = self.group_outputs.get()
+        self.show_command_output(f"$ {command}  →  {len(serials)} dispositivos\n")
+        results = {}
+        lock = threading.Lock()
+        started = time.perf_counter()
+        
+        def run(serial):
+            start = time.perf_counter()
             try:
-                # Ejecutar comando
-                code, stdout, stderr = self.run_command(command, timeout=60)
-                
-                output = ""
-                if stdout:
-                    output += stdout
-                if stderr:
-                    output += f"\nERROR:\n{stderr}"
-                
-                if code == 0:
-                    self.root.after(0, lambda: self.show_command_output(f"{output}\n✅ Comando ejecutado exitosamente\n\n"))
-                else:
-                    self.root.after(0, lambda: self.show_command_output(f"{output}\n❌ Error (código: {code})\n\n"))
-                
+                code, stdout, stderr = self.run_command(self.with_serial(command, serial), timeout=60)
             except Exception as e:
-                self.root.after(0, lambda: self.show_command_output(f"❌ Excepción: {str(e)}\n\n"))
-        
-        threading.Thread(target=execute_thread, daemon=True).start()
-        
-        # Limpiar campo de entrada
-        self.command_var.set("")
+                code, stdout, stderr = -1, "", str(e)
+            output = stdout
+            if stderr:
+                output += f"\nERROR:\n{stderr}"
+            store(serial, (code, output.rstrip(), time.perf_counter() - start))
+        
+        def store(serial, result):
+            with lock:
+                results[serial] = result
+                finished = len(results) == len(serials)
+            self.root.after(0, self.show_fan_out_result, serial, result, group)
+            if finished:
+                self.root.after(0, self.show_fan_out_summary, results, group,
+                                time.perf_counter() - started)
+        
+        for serial in serials:
+            cancelled = functools.partial(store, serial, (-1, "Cancelada", 0.0))
+            self.registry.get(serial).submit("Consola", run, serial, priority=PRIORITY_INTERACTIVE,
+                                             on_cancel=cancelled)
+    
+    def show_fan_out_result(self, serial, result, group):
+        """Salida de un dispositivo de la consola multi-dispositivo (hilo de Tk)"""
+        code, output, elapsed = result
+        icon = "✅" if code == 0 else "❌"
+        if group or not output:
+            self.show_command_output(f"{icon} [{serial}] código {code} ({elapsed:.2f}s)\n")
+        else:
+            self.show_command_output(f"{icon} [{serial}] código {code} ({elapsed:.2f}s)\n{output}\n\n")
+    
+    def show_fan_out_summary(self, results, group, total):
+        """Resumen de códigos y duraciones; con agrupación, salidas únicas (hilo de Tk)"""
+        text = ""
+        if group:
+            groups = {}
+            for serial in sorted(results):
+                code, output, _ = results[serial]
+                groups.setdefault((code, output), []).append(serial)
+            for (code, output), serials in sorted(groups.items(), key=lambda item: -len(item[1])):
+                text += f"── {len(serials)} dispositivo(s), código {code}: {', '.join(serials)}\n"
+                text += f"{output}\n\n" if output else "\n"
+        
+        failed = sorted(serial for serial, (code, _, _) in results.items() if code != 0)
+        durations = [elapsed for _, _, elapsed in results.values()]
+        text += (f"📊 {len(results) - len(failed)}/{len(results)} correctos en {total:.2f}s "
+                 f"(mín {min(durations):.2f}s, máx {max(durations):.2f}s)\n")
+        if failed:
+            text += f"❌ Fallidos: {', '.join(failed)}\n"
+        self.show_command_output(text + "\n")
+    
+    @staticmethod
+    def with_serial(command, serial):
+        """Insertar '-s <serial>' después de 'adb'"""
+        parts = command.split(' ', 1)
+        if len(parts) == 2:
+            return f"{parts[0]} -s \"{serial}\" {parts[1]}"
+        return command
     
     def show_command_output(self, text):
-        """Mostrar salida en el área de comandos"""
-        self.command_output.insert(tk.END, text)
-        self.command_output.see(tk.END)
-        self.root.update_idletasks()
+        """Mostrar salida en el área de comandos (seguro desde cualquier hilo)"""
+        self.console_queue.put(text)
     
     def save_command_output(self):
         """Guardar salida de comandos en archivo"""
-        output_text = self.command_output.get(1.0, tk.END)
+        output_text = self.console_buffer.text()
         if not output_text.strip():
             messagebox.showwarning("Advertencia", "No hay salida para guardar")
             return
@@ -484,7 +3428,7 @@ class ADBFileManagerFixed:
     
     def copy_command_output(self):
         """Copiar salida de comandos al portapapeles"""
-        output_text = self.command_output.get(1.0, tk.END)
+        output_text = self.console_buffer.text()
         if not output_text.strip():
             messagebox.showwarning("Advertencia", "No hay salida para copiar")
             return
@@ -511,11 +3455,67 @@ class ADBFileManagerFixed:
             self.log("⚠️ Procesos logcat terminados")
             self.show_command_output("⚠️ Procesos logcat terminados\n")
         
-        threading.Thread(target=kill_thread, daemon=True).start()
+        self.run_job("Kill logcat", kill_thread)
     
     def clear_command_output(self):
         """Limpiar área de salida de comandos"""
+        drain_queue(self.console_queue)
         self.command_output.delete(1.0, tk.END)
+        self.console_buffer.clear()
+    
+    def create_jobs_frame(self):
+        """Crear panel de tareas en curso y en cola"""
+        jobs_frame = tk.LabelFrame(self.root, text="⚙️ Tareas", 
+                                  font=('Arial', 12, 'bold'), 
+                                  fg='#ecf0f1', bg='#34495e', bd=2)
+        jobs_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.jobs_listbox = tk.Listbox(jobs_frame, height=3, bg='#1e1e1e', fg='#ecf0f1',
+                                       font=('Consolas', 9), exportselection=False)
+        self.jobs_listbox.pack(side='left', fill='x', expand=True, padx=5, pady=5)
+        self.listed_jobs = []  # Ids de las tareas en el orden de la lista
+        
+        tk.Button(jobs_frame, text="✖ Cancelar", 
+                 command=self.cancel_selected_job,
+                 bg='#e74c3c', fg='white', font=('Arial', 9),
+                 relief='flat', padx=10).pack(side='right', padx=5)
+        
+        self.refresh_jobs()
+    
+    def refresh_jobs(self):
+        """Refrescar periódicamente el panel de tareas"""
+        self.render_jobs()
+        self.root.after(500, self.refresh_jobs)
+    
+    def render_jobs(self):
+        """Actualizar la lista de tareas con su tiempo transcurrido (hilo de Tk)"""
+        selected = {self.listed_jobs[i] for i in self.jobs_listbox.curselection()
+                    if i < len(self.listed_jobs)}
+        now = time.monotonic()
+        rows = []
+        self.listed_jobs = []
+        for job in self.jobs.jobs():
+            if job.started is None:
+                rows.append(f"⏳ {job.name} (en cola)")
+            elif job.cancelled:
+                rows.append(f"⏹️ {job.name} cancelando... {now - job.started:.1f}s")
+            else:
+                rows.append(f"▶️ {job.name} {now - job.started:.1f}s")
+            self.listed_jobs.append(job.id)
+        
+        self.jobs_listbox.delete(0, tk.END)
+        for row in rows:
+            self.jobs_listbox.insert(tk.END, row)
+        for index, job_id in enumerate(self.listed_jobs):
+            if job_id in selected:
+                self.jobs_listbox.selection_set(index)
+    
+    def cancel_selected_job(self):
+        """Cancelar las tareas seleccionadas en el panel"""
+        for index in self.jobs_listbox.curselection():
+            if index < len(self.listed_jobs) and self.jobs.cancel(self.listed_jobs[index]):
+                self.log(f"⏹️ Cancelación solicitada: {self.jobs_listbox.get(index)}")
+        self.render_jobs()
     
     def create_log_frame(self):
         """Crear frame de log"""
@@ -537,6 +3537,11 @@ class ADBFileManagerFixed:
                  bg='#95a5a6', fg='white', font=('Arial', 9),
                  relief='flat').pack(side='left', padx=2)
         
+        tk.Button(log_btn_frame, text="💾 Guardar Log", 
+                 command=self.save_log,
+                 bg='#95a5a6', fg='white', font=('Arial', 9),
+                 relief='flat').pack(side='left', padx=2)
+        
         tk.Button(log_btn_frame, text="ℹ️ Acerca de", 
                  command=self.show_about,
                  bg='#95a5a6', fg='white', font=('Arial', 9),
@@ -570,16 +3575,47 @@ class ADBFileManagerFixed:
         """Agregar mensaje al log"""
         timestamp = time.strftime("%H:%M:%S")
         formatted_message = f"[{timestamp}] {message}\n"
-        self.log_text.insert(tk.END, formatted_message)
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        self.log_queue.put(formatted_message)  # Seguro desde cualquier hilo
+    
+    def flush_output(self):
+        """Volcar log y consola con una inserción por widget (hilo de Tk)"""
+        text = drain_queue(self.log_queue)
+        if text:
+            self.log_buffer.write(self.log_text, text)
+        text = drain_queue(self.console_queue)
+        if text:
+            self.console_buffer.write(self.command_output, text)
+        self.root.after(UI_FLUSH_MS, self.flush_output)
     
     def clear_log(self):
         """Limpiar el log"""
+        drain_queue(self.log_queue)
         self.log_text.delete(1.0, tk.END)
+        self.log_buffer.clear()
+    
+    def save_log(self):
+        """Guardar el log completo (buffer, no solo lo visible) en archivo"""
+        file_path = filedialog.asksaveasfilename(
+            title="Guardar log",
+            defaultextension=".txt",
+            filetypes=[("Archivos de texto", "*.txt"), ("Todos los archivos", "*.*")]
+        )
+        
+        if file_path:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(self.log_buffer.text())
+                messagebox.showinfo("Éxito", f"Log guardado en:\n{file_path}")
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudo guardar:\n{e}")
     
     def run_command(self, command, timeout=30):
         """Ejecutar comando usando ADB incluido"""
+        if USE_NATIVE_ADB:
+            result = self.run_native_command(command, timeout)
+            if result is not None:
+                return result
+        
         try:
             # Si el comando empieza con 'adb', usar el ADB incluido
             if command.startswith('adb'):
@@ -596,6 +3632,78 @@ class ADBFileManagerFixed:
         except Exception as e:
             return -1, "", str(e)
     
+    def run_native_command(self, command, timeout=30):
+        """Ejecutar comando 'adb ...' con el cliente nativo.
+        
+        Devuelve None si el comando no se puede traducir o el servidor no
+        responde, para que run_command use el ejecutable como fallback.
+        """
+        # Las redirecciones deben resolverse en el shell local
+        if re.search(r'[<>`]', command):
+            return None
+        
+        try:
+            args = shlex.split(command)
+            lexer = shlex.shlex(command, posix=True, punctuation_chars="|&;")
+            lexer.whitespace_split = True
+            tokens = list(lexer)
+        except ValueError:
+            return None
+        
+        # Tuberías y separadores sin comillas los interpreta el shell local
+        # ('adb shell ps | findstr x'); solo van al dispositivo si están
+        # dentro del comando remoto entrecomillado ('adb shell "ps | grep x"')
+        if any(token and set(token) <= set("|&;") for token in tokens):
+            return None
+        
+        if not args or args[0] != 'adb':
+            return None
+        args = args[1:]
+        
+        serial = None
+        if len(args) >= 2 and args[0] == '-s':
+            serial, args = args[1], args[2:]
+        if not args:
+            return None
+        
+        client = ADBClient(self.adb_client.host, self.adb_client.port, timeout)
+        action, params = args[0], args[1:]
+        
+        try:
+            if action == 'devices' and params in ([], ['-l']):
+                listing = client.devices(long=bool(params))
+                return 0, "List of devices attached\n" + listing + "\n", ""
+            if action == 'shell' and params:
+                remote_command = " ".join(params)
+                if serial:
+                    # Sesión persistente: sin proceso ni shell nuevos por comando
+                    result = self.shell_pool.run(serial, remote_command, timeout)
+                    if result is not None:
+                        return result
+                return client.shell(serial, remote_command, timeout)
+            if action == 'connect' and len(params) == 1:
+                message = client.connect(params[0])
+                return (0 if "connected" in message.lower() else 1), message + "\n", ""
+            if action == 'disconnect' and len(params) <= 1:
+                message = client.disconnect(params[0] if params else "")
+                return 0, message + "\n", ""
+            if action == 'get-state' and not params:
+                return 0, client.get_state(serial) + "\n", ""
+            if action == 'kill-server' and not params:
+                client.kill_server()
+                return 0, "", ""
+            if action == 'start-server' and not params and client.is_available():
+                return 0, "", ""
+        except ADBError as e:
+            return 1, "", f"adb: error: {e}"
+        except socket.timeout:
+            return -1, "", "Timeout"
+        except OSError:
+            # Servidor ADB no disponible: el ejecutable lo arrancará
+            return None
+        
+        return None
+    
     def check_adb(self):
         """Verificar ADB"""
         adb_path = get_adb_path()
@@ -628,13 +3736,9 @@ class ADBFileManagerFixed:
     
     def show_current_devices(self):
         """Mostrar dispositivos actuales"""
-        code, stdout, stderr = self.run_command("adb devices")
-        if code == 0:
-            devices = []
-            for line in stdout.split('\n'):
-                if '\t' in line and 'device' in line:
-                    device_id = line.split('\t')[0].strip()
-                    devices.append(device_id)
+        table = self.list_devices()
+        if table is not None:
+            devices = [serial for serial, entry in table.items() if entry.state == 'device']
             
             if devices:
                 self.log(f"📱 Dispositivos detectados: {len(devices)}")
@@ -643,6 +3747,253 @@ class ADBFileManagerFixed:
             else:
                 self.log("📱 No hay dispositivos conectados")
     
+    def list_devices(self):
+        """Tabla {serial: DeviceEntry}; usa el seguimiento en vivo si está sincronizado"""
+        if self.device_tracker.synced:
+            return self.device_tracker.snapshot()
+        
+        code, stdout, stderr = self.run_command("adb devices -l")
+        if code != 0:
+            return None
+        return parse_device_list(stdout)
+    
+    def on_devices_changed(self, added, removed, changed, initial):
+        """Aplicar cambios de la tabla de dispositivos a la UI (hilo de Tk)"""
+        if not initial:
+            for entry in added:
+                model = f" ({entry.model})" if entry.model else ""
+                self.log(f"📱 Dispositivo detectado: {entry.serial}{model} [{entry.state}]")
+            for entry in changed:
+                self.log(f"🔁 {entry.serial}: {entry.state}")
+            for entry in removed:
+                self.log(f"🔌 Dispositivo desaparecido: {entry.serial}")
+        
+        for entry in removed:
+            self.shell_pool.close(entry.serial)
+            if self.is_selected(entry.serial):
+                self.log(f"⚠️ Dispositivo seleccionado perdido: {entry.serial}")
+        
+        self.registry.sync(self.device_tracker.snapshot())
+        self.refresh_device_list()
+    
+    def refresh_device_list(self):
+        """Repintar la lista de dispositivos conservando la selección (hilo de Tk)"""
+        selected = {self.listed_serials[i] for i in self.device_listbox.curselection()
+                    if i < len(self.listed_serials)}
+        sessions = self.registry.all()
+        
+        self.device_listbox.delete(0, tk.END)
+        self.listed_serials = [session.serial for session in sessions]
+        for index, session in enumerate(sessions):
+            self.device_listbox.insert(tk.END, session.label())
+            if session.serial in selected:
+                self.device_listbox.selection_set(index)
+        
+        self.update_ui_connection(any(session.ready for session in sessions))
+        self.update_target_label()
+    
+    def is_selected(self, serial):
+        selected = self.device_listbox.curselection()
+        return any(self.listed_serials[i] == serial for i in selected
+                   if i < len(self.listed_serials))
+    
+    def select_devices(self, serials, add=True, table=None):
+        """Seleccionar dispositivos en la lista (hilo de Tk)"""
+        if table is not None:
+            self.registry.sync(table)
+        self.refresh_device_list()
+        if not add:
+            self.device_listbox.selection_clear(0, tk.END)
+        for serial in serials:
+            if serial in self.listed_serials:
+                self.device_listbox.selection_set(self.listed_serials.index(serial))
+        self.update_target_label()
+    
+    def get_targets(self):
+        """Seriales destino de las operaciones (hilo de Tk).
+        
+        Modo "Todos": todos los dispositivos listos. Modo "Selección": los
+        seleccionados, o el único dispositivo listo si no hay selección.
+        """
+        ready = self.registry.ready_serials()
+        if self.target_mode.get() == "all":
+            return ready
+        
+        selected = [self.listed_serials[i] for i in self.device_listbox.curselection()
+                    if i < len(self.listed_serials)]
+        selected = [serial for serial in selected if serial in ready]
+        if not selected and len(ready) == 1:
+            return ready
+        return selected
+    
+    def update_target_label(self):
+        """Mostrar los dispositivos destino actuales"""
+        targets = self.get_targets()
+        if not targets:
+            self.device_info_label.config(text="Dispositivo: Ninguno")
+        elif len(targets) == 1:
+            self.device_info_label.config(text=f"Dispositivo: {targets[0]}")
+        else:
+            self.device_info_label.config(text=f"Dispositivos ({len(targets)}): {', '.join(targets)}")
+    
+    def require_targets(self):
+        """Destinos de la operación o None (con aviso) si no hay ninguno"""
+        targets = self.get_targets()
+        if not targets:
+            messagebox.showerror("Error", "Dispositivo no conectado")
+            return None
+        return targets
+    
+    def run_job(self, name, func, *args, priority=PRIORITY_NORMAL, on_cancel=None):
+        """Lanzar una tarea en el pool salvo que ya haya otra igual en curso"""
+        job = self.jobs.submit(name, func, *args, priority=priority, key=name, on_cancel=on_cancel)
+        if job is None:
+            self.log(f"⏳ {name}: ya está en curso")
+        return job
+    
+    def run_on_devices(self, name, serials, job, on_complete=None):
+        """Ejecutar job(serial) en la cola de cada dispositivo.
+        
+        job devuelve (ok, mensaje); on_complete({serial: (ok, mensaje)}) se
+        llama en el hilo del último dispositivo en terminar. Un dispositivo
+        que ya tiene la misma operación en curso cuenta como fallo.
+        """
+        results = {}
+        lock = threading.Lock()
+        
+        def run(serial):
+            try:
+                result = job(serial)
+            except Exception as e:
+                result = (False, str(e))
+            store(serial, result)
+        
+        def store(serial, result):
+            with lock:
+                results[serial] = result
+                finished = len(results) == len(serials)
+            if finished and on_complete:
+                on_complete(results)
+        
+        duplicated = [serial for serial in serials
+                      if self.registry.get(serial).submit(
+                          name, run, serial, key=(name, serial),
+                          on_cancel=functools.partial(store, serial, (False, "Cancelada"))) is None]
+        if len(duplicated) == len(serials):
+            self.log(f"⏳ {name}: ya está en curso")
+            return
+        for serial in duplicated:
+            store(serial, (False, "Operación ya en curso"))
+    
+    @staticmethod
+    def device_path(path, serial, multiple):
+        """Ruta local por dispositivo cuando la operación afecta a varios"""
+        if not multiple:
+            return path
+        root, ext = os.path.splitext(path)
+        safe_serial = re.sub(r'[^A-Za-z0-9._-]', '_', serial)
+        return f"{root}_{safe_serial}{ext}"
+    
+    def report_results(self, title, results, success_text):
+        """Resumen final de una operación sobre uno o varios dispositivos"""
+        failed = {serial: message for serial, (ok, message) in results.items() if not ok}
+        if len(results) == 1:
+            serial, (ok, message) = next(iter(results.items()))
+            if ok:
+                messagebox.showinfo("Éxito", message)
+            else:
+                messagebox.showerror("Error", message)
+            return
+        
+        summary = f"{success_text}: {len(results) - len(failed)}/{len(results)} dispositivos"
+        self.log(f"📊 {title}: {summary}")
+        if failed:
+            details = "\n".join(f"{serial}: {message}" for serial, message in failed.items())
+            messagebox.showwarning(title, f"{summary}\n\nFallos:\n{details}")
+        else:
+            messagebox.showinfo(title, summary)
+    
+    def on_mdns_changed(self):
+        """Registrar servicios ADB nuevos anunciados por mDNS (hilo de Tk)"""
+        for entry in self.mdns.services():
+            key = (entry.service, entry.name, entry.ip, entry.port)
+            if key not in self.mdns_seen:
+                self.mdns_seen.add(key)
+                kind = "emparejamiento" if entry.service == ADB_PAIRING_SERVICE else "conexión"
+                self.log(f"📡 mDNS: {entry.name} ({kind}) en {entry.ip}:{entry.port}")
+    
+    def discover_mdns(self):
+        """Consultar mDNS y 'adb mdns services' y mostrar los servicios encontrados"""
+        self.log("📡 Buscando servicios ADB por mDNS...")
+        self.mdns.query()
+        
+        def mdns_thread():
+            code, stdout, stderr = self.run_command("adb mdns services", timeout=10)
+            if code == 0:
+                self.mdns.refresh_from_adb(stdout)
+            wait_until(self.mdns.services, 1.0)  # Margen para las respuestas multicast
+            
+            services = self.mdns.services()
+            if services:
+                self.log(f"📡 {len(services)} servicios ADB anunciados:")
+                for entry in services:
+                    kind = "emparejamiento" if entry.service == ADB_PAIRING_SERVICE else "conexión"
+                    self.log(f"   🔗 {entry.name} ({kind}) {entry.ip}:{entry.port}")
+                
+                connect = [e for e in services if e.service == ADB_CONNECT_SERVICE]
+                if connect:
+                    self.root.after(0, self.fill_endpoint, connect[0].ip, connect[0].port)
+            else:
+                self.log("📡 No hay servicios ADB anunciados")
+        
+        self.run_job("Descubrir mDNS", mdns_thread, priority=PRIORITY_BACKGROUND)
+    
+    def pick_mdns_endpoint(self, service):
+        """Elegir un extremo anunciado por mDNS para el servicio dado.
+        
+        Si la IP introducida coincide con algún anuncio se restringe a ella; con
+        varios candidatos se pregunta al usuario. Devuelve (ip, puerto) o None.
+        """
+        candidates = self.mdns.services(service)
+        ip = self.device_ip.get().strip()
+        same_ip = [entry for entry in candidates if entry.ip == ip]
+        if same_ip:
+            candidates = same_ip
+        
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0].ip, candidates[0].port
+        
+        options = "\n".join(f"{i}. {entry.name} - {entry.ip}:{entry.port}"
+                            for i, entry in enumerate(candidates, 1))
+        choice = simpledialog.askinteger("mDNS", f"Dispositivos anunciados:\n{options}\n\nNúmero:",
+                                         minvalue=1, maxvalue=len(candidates))
+        if not choice:
+            return None
+        entry = candidates[choice - 1]
+        return entry.ip, entry.port
+    
+    def wait_phase(self, description, condition, timeout):
+        """Esperar una condición registrando cuánto tardó la fase"""
+        ok, elapsed = wait_until(condition, timeout)
+        if ok:
+            self.log(f"⏱️ {description}: {elapsed:.2f}s")
+        else:
+            self.log(f"⚠️ {description}: sin confirmar tras {elapsed:.1f}s")
+        return ok
+    
+    def server_down(self):
+        return not self.adb_client.is_available(timeout=0.2)
+    
+    def server_ready(self):
+        return self.adb_client.is_available(timeout=0.2)
+    
+    def device_ready(self, serial):
+        """¿Aparece el dispositivo en estado 'device'?"""
+        table = self.list_devices()
+        return bool(table) and serial in table and table[serial].state == 'device'
+    
     def is_placeholder(self, value, placeholder):
         """Verificar si el valor es un placeholder"""
         return value == placeholder or value.strip() == ""
@@ -654,9 +4005,10 @@ class ADBFileManagerFixed:
         def clean_thread():
             # PASO 1: Matar servidor ADB completamente
             self.log("🔪 Matando servidor ADB...")
-            for _ in range(3):  # Triple kill
+            for _ in range(3):  # Hasta tres intentos, solo si sigue vivo
                 self.run_command("adb kill-server", timeout=10)
-                time.sleep(1)
+                if self.wait_phase("Servidor ADB detenido", self.server_down, 2):
+                    break
             
             # PASO 2: Matar procesos del sistema
             if platform.system() == "Windows":
@@ -664,7 +4016,7 @@ class ADBFileManagerFixed:
             else:
                 self.run_command("pkill -9 adb", timeout=10)
             
-            time.sleep(3)
+            self.wait_phase("Procesos ADB terminados", self.server_down, 5)
             
             # PASO 3: Reiniciar limpio
             self.log("🔄 Reiniciando ADB limpio...")
@@ -674,18 +4026,16 @@ class ADBFileManagerFixed:
                 self.log("✅ ADB reiniciado limpiamente")
                 
                 # PASO 4: Verificar limpieza
-                time.sleep(2)
+                self.wait_phase("Servidor ADB aceptando conexiones", self.server_ready, 10)
                 self.show_current_devices()
                 
                 # Reset estado
-                self.connected = False
-                self.target_device = None
-                self.root.after(0, self.update_ui_connection, False)
+                self.root.after(0, self.select_devices, [], False)
                 
             else:
                 self.log(f"❌ Error reiniciando ADB: {stderr}")
         
-        threading.Thread(target=clean_thread, daemon=True).start()
+        self.run_job("Limpieza total", clean_thread)
     
     def pair_device(self):
         """Emparejar dispositivo"""
@@ -693,6 +4043,13 @@ class ADBFileManagerFixed:
         port = self.device_port.get().strip()
         code = self.pairing_code.get().strip()
         
+        if self.is_placeholder(port, "Puerto"):
+            # Sin puerto: usar el servicio de emparejamiento anunciado por mDNS
+            endpoint = self.pick_mdns_endpoint(ADB_PAIRING_SERVICE)
+            if endpoint:
+                ip, port = endpoint[0], str(endpoint[1])
+                self.fill_endpoint(ip, port)
+        
         if not ip:
             messagebox.showerror("Error", "Introduce la IP del dispositivo")
             return
@@ -710,12 +4067,14 @@ class ADBFileManagerFixed:
         def pair_thread():
             # Limpieza previa
             self.run_command("adb kill-server")
-            time.sleep(2)
+            self.wait_phase("Servidor ADB detenido", self.server_down, 5)
             self.run_command("adb start-server")
-            time.sleep(2)
+            self.wait_phase("Servidor ADB aceptando conexiones", self.server_ready, 10)
             
             # Intentar emparejamiento
+            started = time.monotonic()
             code_result, stdout, stderr = self.run_command(f"adb pair {ip}:{port} {code}")
+            self.log(f"⏱️ Emparejamiento: {time.monotonic() - started:.2f}s")
             
             if code_result == 0 and "Successfully paired" in stdout:
                 self.log("✅ Emparejamiento exitoso!")
@@ -727,13 +4086,20 @@ class ADBFileManagerFixed:
                 error_msg = stderr or stdout or "Error desconocido"
                 self.log(f"❌ Error: {error_msg}")
         
-        threading.Thread(target=pair_thread, daemon=True).start()
+        self.run_job("Emparejar", pair_thread)
     
     def connect_clean(self):
         """Conectar de forma limpia (sin duplicados)"""
         ip = self.device_ip.get().strip()
         port = self.device_port.get().strip()
         
+        if self.is_placeholder(port, "Puerto"):
+            # Sin puerto: usar el servicio de conexión anunciado por mDNS
+            endpoint = self.pick_mdns_endpoint(ADB_CONNECT_SERVICE)
+            if endpoint:
+                ip, port = endpoint[0], str(endpoint[1])
+                self.fill_endpoint(ip, port)
+        
         if not ip or self.is_placeholder(port, "Puerto"):
             messagebox.showerror("Error", "Introduce IP y puerto válidos")
             return
@@ -742,123 +4108,107 @@ class ADBFileManagerFixed:
         self.log(f"🔗 Conectando a {target}...")
         
         def connect_thread():
-            # PASO 1: Limpieza total antes de conectar
-            self.log("🧹 Limpiando conexiones existentes...")
-            
-            # Desconectar TODO
-            self.run_command("adb disconnect", timeout=10)
-            time.sleep(1)
-            
-            # Verificar que no queda nada
-            code, stdout, stderr = self.run_command("adb devices")
-            if code == 0:
-                existing = [line.split('\t')[0] for line in stdout.split('\n') 
-                           if '\t' in line and 'device' in line]
-                
-                # Forzar desconexión de cada dispositivo individualmente
-                for device in existing:
-                    self.log(f"🔌 Forzando desconexión: {device}")
-                    self.run_command(f"adb disconnect {device}")
-                
-                time.sleep(2)
+            # PASO 1: Quitar solo duplicados del mismo host (otros puertos de la misma IP);
+            # el resto de dispositivos conectados no se tocan
+            table = self.list_devices() or {}
+            duplicates = [serial for serial in table
+                          if serial != target and serial.rsplit(':', 1)[0] == ip]
+            for device in duplicates:
+                self.log(f"🔌 Quitando conexión duplicada: {device}")
+                self.run_command(f"adb disconnect {device}")
             
-            # PASO 2: Conectar SOLO el dispositivo objetivo
-            self.log(f"🎯 Conectando únicamente a {target}...")
+            # PASO 2: Conectar el dispositivo objetivo
+            self.log(f"🎯 Conectando a {target}...")
+            started = time.monotonic()
             code, stdout, stderr = self.run_command(f"adb connect {target}")
+            self.log(f"⏱️ adb connect: {time.monotonic() - started:.2f}s")
             
             if code == 0 and "connected" in stdout.lower():
                 # PASO 3: Verificación final
-                time.sleep(2)
-                verify_code, verify_out, verify_err = self.run_command("adb devices")
-                
-                if verify_code == 0:
-                    connected_devices = [line.split('\t')[0] for line in verify_out.split('\n') 
-                                       if '\t' in line and 'device' in line]
-                    
-                    if len(connected_devices) == 1 and connected_devices[0] == target:
-                        self.log("✅ Conexión única exitosa!")
-                        self.target_device = target
-                        self.connected = True
-                        self.root.after(0, self.update_ui_connection, True)
-                        self.root.after(0, lambda: self.device_info_label.config(text=f"Dispositivo: {target}"))
-                    else:
-                        self.log(f"⚠️ Múltiples dispositivos detectados: {len(connected_devices)}")
-                        self.log("💡 Usa 'Limpiar Todo' y vuelve a intentar")
-                        self.root.after(0, self.update_ui_connection, False)
+                if self.wait_phase(f"{target} en estado 'device'",
+                                   lambda: self.device_ready(target), 10):
+                    self.log("✅ Conexión exitosa!")
+                    self.root.after(0, self.select_devices, [target], True, self.list_devices())
                 else:
                     self.log("❌ Error verificando conexión")
-                    self.root.after(0, self.update_ui_connection, False)
             else:
                 error = stderr or stdout or "Error desconocido"
                 self.log(f"❌ Error conectando: {error}")
-                self.root.after(0, self.update_ui_connection, False)
         
-        threading.Thread(target=connect_thread, daemon=True).start()
+        self.run_job("Conectar", connect_thread)
     
     def connect_usb(self):
         """Conectar dispositivo USB"""
         self.log("🔌 Buscando dispositivos USB...")
         
         def usb_thread():
-            code, stdout, stderr = self.run_command("adb devices")
+            table = self.list_devices()
             
-            if code == 0:
-                usb_devices = []
-                for line in stdout.split('\n'):
-                    if '\t' in line and 'device' in line:
-                        device_id = line.split('\t')[0].strip()
-                        if ':' not in device_id:  # USB no tiene ':'
-                            usb_devices.append(device_id)
+            if table is not None:
+                usb_devices = [serial for serial, entry in table.items()
+                               if entry.state == 'device' and entry.connection == 'USB']
                 
                 if usb_devices:
-                    self.target_device = usb_devices[0]
-                    self.connected = True
-                    self.log(f"✅ USB conectado: {self.target_device}")
-                    self.root.after(0, self.update_ui_connection, True)
-                    self.root.after(0, lambda: self.device_info_label.config(text=f"Dispositivo USB: {self.target_device}"))
+                    for device in usb_devices:
+                        self.log(f"✅ USB conectado: {device}")
+                    self.root.after(0, self.select_devices, usb_devices, True, table)
                 else:
                     self.log("❌ No hay dispositivos USB")
-                    self.root.after(0, self.update_ui_connection, False)
             else:
                 self.log("❌ Error verificando USB")
         
-        threading.Thread(target=usb_thread, daemon=True).start()
+        self.run_job("Conectar USB", usb_thread)
     
     def disconnect_clean(self):
-        """Desconectar limpiamente"""
+        """Desconectar limpiamente los dispositivos destino"""
+        targets = self.get_targets()
+        if not targets:
+            messagebox.showerror("Error", "Selecciona los dispositivos a desconectar")
+            return
+        
         self.log("🔌 Desconectando...")
         
         def disconnect_thread():
-            if self.target_device:
-                self.run_command(f"adb disconnect {self.target_device}")
-            
-            self.run_command("adb disconnect")  # Desconectar todo por si acaso
+            for serial in targets:
+                session = self.registry.get(serial)
+                if session.connection == 'TCP':
+                    self.run_command(f"adb disconnect {serial}")
+                    self.log(f"✅ Desconectado: {serial}")
+                else:
+                    self.log(f"💡 {serial} es USB: se quita de la selección")
             
-            self.connected = False
-            self.target_device = None
-            self.root.after(0, self.update_ui_connection, False)
-            self.root.after(0, lambda: self.device_info_label.config(text="Dispositivo: Ninguno"))
-            self.log("✅ Desconectado")
+            self.root.after(0, self.deselect_devices, targets)
         
-        threading.Thread(target=disconnect_thread, daemon=True).start()
+        self.run_job("Desconectar", disconnect_thread)
+    
+    def deselect_devices(self, serials):
+        """Quitar dispositivos de la selección (hilo de Tk)"""
+        for serial in serials:
+            if serial in self.listed_serials:
+                self.device_listbox.selection_clear(self.listed_serials.index(serial))
+        self.update_target_label()
     
     def update_ui_connection(self, connected):
         """Actualizar UI según conexión"""
         self.connected = connected
         
         if connected:
-            self.status_label.config(text="● Conectado", fg='#27ae60')
-            self.connect_btn.config(state='disabled')
-            self.pair_btn.config(state='disabled')
-            self.usb_btn.config(state='disabled')
+            ready = len(self.registry.ready_serials())
+            self.status_label.config(text=f"● Conectado ({ready})", fg='#27ae60')
+            # Se pueden seguir añadiendo dispositivos
+            self.connect_btn.config(state='normal')
+            self.pair_btn.config(state='normal')
+            self.usb_btn.config(state='normal')
             self.disconnect_btn.config(state='normal')
             
-            if self.selected_file.get():
+            if self.selected_files:
                 self.push_btn.config(state='normal')
                 if self.selected_file.get().endswith('.apk'):
                     self.install_btn.config(state='normal')
             
             self.pull_btn.config(state='normal')
+            self.pull_dir_btn.config(state='normal')
+            self.sync_btn.config(state='normal')
         else:
             self.status_label.config(text="● Desconectado", fg='#e74c3c')
             self.connect_btn.config(state='normal')
@@ -868,48 +4218,49 @@ class ADBFileManagerFixed:
             self.install_btn.config(state='disabled')
             self.push_btn.config(state='disabled')
             self.pull_btn.config(state='disabled')
+            self.pull_dir_btn.config(state='disabled')
+            self.sync_btn.config(state='disabled')
     
     def show_adb_status(self):
         """Mostrar estado detallado de ADB"""
+        targets = self.get_targets()
+        
         def status_thread():
-            code, stdout, stderr = self.run_command("adb devices -l")
+            table = self.list_devices()
             
             status_text = "📊 ESTADO ADB\n" + "="*30 + "\n\n"
             
-            if code == 0:
-                lines = stdout.strip().split('\n')[1:]  # Skip header
-                if lines and any(line.strip() for line in lines):
-                    status_text += f"Dispositivos encontrados: {len([l for l in lines if l.strip()])}\n\n"
+            if table is not None:
+                if table:
+                    status_text += f"Dispositivos encontrados: {len(table)}\n\n"
                     
-                    for line in lines:
-                        if line.strip():
-                            parts = line.split()
-                            if len(parts) >= 2:
-                                device_id = parts[0]
-                                status = parts[1]
-                                
-                                status_text += f"📱 {device_id}\n"
-                                status_text += f"   Estado: {status}\n"
-                                status_text += f"   Tipo: {'USB' if ':' not in device_id else 'Red'}\n\n"
+                    for entry in table.values():
+                        status_text += f"📱 {entry.serial}\n"
+                        status_text += f"   Estado: {entry.state}\n"
+                        if entry.model:
+                            status_text += f"   Modelo: {entry.model}\n"
+                        if entry.transport_id:
+                            status_text += f"   Transporte: {entry.transport_id}\n"
+                        status_text += f"   Tipo: {'USB' if entry.connection == 'USB' else 'Red'}\n\n"
                 else:
                     status_text += "❌ No hay dispositivos conectados\n"
             else:
-                status_text += f"❌ Error: {stderr}\n"
+                status_text += "❌ Error: no se pudo consultar el servidor ADB\n"
             
-            if self.target_device:
-                status_text += f"\n🎯 Dispositivo activo: {self.target_device}\n"
+            if targets:
+                status_text += f"\n🎯 Destino: {', '.join(targets)}\n"
             
             status_text += f"\n📱 App: {APP_TITLE} v{APP_VERSION}\n"
             status_text += f"👨‍💻 Por: {DEVELOPER}\n"
             
             messagebox.showinfo("Estado ADB", status_text)
         
-        threading.Thread(target=status_thread, daemon=True).start()
+        self.run_job("Estado ADB", status_thread)
     
     def select_file(self):
-        """Seleccionar archivo"""
-        file_path = filedialog.askopenfilename(
-            title="Seleccionar archivo",
+        """Seleccionar uno o varios archivos"""
+        file_paths = filedialog.askopenfilenames(
+            title="Seleccionar archivos",
             filetypes=[
                 ("Archivos APK", "*.apk"),
                 ("Documentos", "*.pdf;*.doc;*.docx;*.txt"),
@@ -920,8 +4271,13 @@ class ADBFileManagerFixed:
             ]
         )
         
-        if file_path:
+        if len(file_paths) > 1:
+            self.set_selected_files([(path, os.path.basename(path)) for path in file_paths],
+                                    f"{len(file_paths)} archivos")
+        elif file_paths:
+            file_path = file_paths[0]
             self.selected_file.set(file_path)
+            self.selected_files = [(file_path, os.path.basename(file_path))]
             filename = os.path.basename(file_path)
             file_size = os.path.getsize(file_path) / (1024*1024)
             
@@ -935,10 +4291,39 @@ class ADBFileManagerFixed:
                 else:
                     self.install_btn.config(state='disabled')
     
+    def select_folder(self):
+        """Seleccionar una carpeta completa para enviarla"""
+        folder = filedialog.askdirectory(title="Seleccionar carpeta")
+        if not folder:
+            return
+        
+        base = os.path.dirname(os.path.abspath(folder))
+        entries = []
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                entries.append((path, os.path.relpath(path, base).replace(os.sep, '/')))
+        if not entries:
+            messagebox.showwarning("Advertencia", "La carpeta está vacía")
+            return
+        self.set_selected_files(entries, f"{os.path.basename(folder)}/ ({len(entries)} archivos)")
+    
+    def set_selected_files(self, entries, description):
+        """Selección de varios archivos (solo se pueden enviar, no instalar)"""
+        self.selected_files = entries
+        self.selected_file.set("")
+        total = sum(os.path.getsize(path) for path, _ in entries) / (1024*1024)
+        self.file_label.config(text=f"📄 {description} ({total:.1f} MB)", fg='#ecf0f1')
+        self.log(f"📁 Seleccionados: {description}")
+        
+        if self.connected:
+            self.push_btn.config(state='normal')
+            self.install_btn.config(state='disabled')
+    
     def install_apk(self):
-        """Instalar APK usando dispositivo específico"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        """Instalar APK en los dispositivos destino"""
+        targets = self.require_targets()
+        if not targets:
             return
         
         apk_path = self.selected_file.get()
@@ -948,38 +4333,38 @@ class ADBFileManagerFixed:
         
         self.install_btn.config(state='disabled')
         self.progress.start()
+        filename = os.path.basename(apk_path)
         
-        def install_thread():
-            filename = os.path.basename(apk_path)
-            self.log(f"📦 Instalando {filename} en {self.target_device}...")
+        def install_job(serial):
+            self.log(f"📦 Instalando {filename} en {serial}...")
             
             # Comando específico para el dispositivo
-            cmd = f'adb -s "{self.target_device}" install "{apk_path}"'
+            cmd = f'adb -s "{serial}" install "{apk_path}"'
             code, stdout, stderr = self.run_command(cmd, timeout=120)
             
-            self.root.after(0, self.progress.stop)
-            
             if code == 0 and "Success" in stdout:
-                self.log(f"✅ {filename} instalado exitosamente")
-                messagebox.showinfo("Éxito", f"APK instalado: {filename}")
-            else:
-                error = stderr or stdout or "Error desconocido"
-                self.log(f"❌ Error instalando: {error}")
-                messagebox.showerror("Error", f"No se pudo instalar:\n{error}")
-            
+                self.log(f"✅ {filename} instalado exitosamente en {serial}")
+                return True, f"APK instalado: {filename}"
+            error = stderr or stdout or "Error desconocido"
+            self.log(f"❌ Error instalando en {serial}: {error}")
+            return False, f"No se pudo instalar:\n{error}"
+        
+        def install_done(results):
+            self.root.after(0, self.progress.stop)
+            self.report_results("Instalación", results, "Instalado")
             if self.connected:
                 self.root.after(0, lambda: self.install_btn.config(state='normal'))
         
-        threading.Thread(target=install_thread, daemon=True).start()
+        self.run_on_devices("Instalar APK", targets, install_job, install_done)
     
     def push_file(self):
-        """Enviar archivo usando dispositivo específico"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        """Enviar archivo a los dispositivos destino"""
+        targets = self.require_targets()
+        if not targets:
             return
         
         file_path = self.selected_file.get()
-        if not file_path:
+        if not self.selected_files:
             messagebox.showerror("Error", "Selecciona un archivo")
             return
         
@@ -991,37 +4376,68 @@ class ADBFileManagerFixed:
             return
         
         self.push_btn.config(state='disabled')
-        self.progress.start()
+        if not file_path:
+            self.push_files(targets, self.selected_files, dest_path)
+            return
         
-        def push_thread():
-            filename = os.path.basename(file_path)
-            full_dest = dest_path + filename if dest_path.endswith('/') else dest_path
-            
-            self.log(f"📤 Enviando {filename} a {self.target_device}...")
-            
-            # Comando específico para el dispositivo
-            cmd = f'adb -s "{self.target_device}" push "{file_path}" "{full_dest}"'
-            code, stdout, stderr = self.run_command(cmd, timeout=300)
+        filename = os.path.basename(file_path)
+        full_dest = dest_path + filename if dest_path.endswith('/') else dest_path
+        progress = self.start_transfer(os.path.getsize(file_path) * len(targets))
+        
+        def push_job(serial):
+            self.log(f"📤 Enviando {filename} a {serial}...")
             
-            self.root.after(0, self.progress.stop)
+            try:
+                remote = self.sync_push(serial, file_path, full_dest, progress)
+            except (OSError, ADBError) as e:
+                error = self.transfer_error(e)
+                self.log(f"❌ Error enviando a {serial}: {error}")
+                return False, f"No se pudo enviar:\n{error}"
             
-            if code == 0:
-                self.log(f"✅ {filename} enviado exitosamente")
-                messagebox.showinfo("Éxito", f"Archivo enviado a:\n{full_dest}")
-            else:
-                error = stderr or stdout or "Error desconocido"
-                self.log(f"❌ Error enviando: {error}")
-                messagebox.showerror("Error", f"No se pudo enviar:\n{error}")
+            self.log(f"✅ {filename} enviado exitosamente a {serial}")
+            return True, f"Archivo enviado a:\n{remote}"
+        
+        def push_done(results):
+            self.root.after(0, self.finish_transfer, progress)
+            self.report_results("Envío", results, "Enviado")
+            if self.connected:
+                self.root.after(0, lambda: self.push_btn.config(state='normal'))
+        
+        self.run_on_devices("Enviar archivo", targets, push_job, push_done)
+    
+    def push_files(self, targets, entries, dest_dir):
+        """Enviar varios archivos o una carpeta con la cola de transferencias"""
+        dest_dir = dest_dir.rstrip('/') + '/'
+        files = [(local, dest_dir + relative) for local, relative in entries]
+        progress = self.start_transfer(sum(os.path.getsize(local) for local, _ in files) * len(targets))
+        
+        def push_job(serial):
+            self.log(f"📤 Enviando {len(files)} archivos a {serial}:{dest_dir}...")
+            results = TreePush(serial, files, progress).run()
+            failed = {remote: error for remote, error in results.items() if error}
+            for remote, error in failed.items():
+                self.log(f"❌ {serial}: {remote}: {error}")
             
+            sent = sum(1 for error in results.values() if error is None)
+            summary = f"{sent}/{len(files)} archivos enviados a {dest_dir}"
+            self.log(f"{'✅' if not failed else '⚠️'} {serial}: {summary}")
+            if failed:
+                details = "\n".join(f"{remote}: {error}" for remote, error in list(failed.items())[:10])
+                return False, f"{summary}\n{details}"
+            return True, summary
+        
+        def push_done(results):
+            self.root.after(0, self.finish_transfer, progress)
+            self.report_results("Envío", results, "Enviado")
             if self.connected:
                 self.root.after(0, lambda: self.push_btn.config(state='normal'))
         
-        threading.Thread(target=push_thread, daemon=True).start()
+        self.run_on_devices("Enviar archivos", targets, push_job, push_done)
     
     def pull_file(self):
-        """Descargar archivo usando dispositivo específico"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        """Descargar archivo de los dispositivos destino"""
+        targets = self.require_targets()
+        if not targets:
             return
         
         remote_path = simpledialog.askstring("Archivo Remoto", 
@@ -1040,39 +4456,273 @@ class ADBFileManagerFixed:
             return
         
         self.pull_btn.config(state='disabled')
-        self.progress.start()
+        multiple = len(targets) > 1
+        progress = self.start_transfer()
         
-        def pull_thread():
-            self.log(f"📥 Descargando {remote_path} de {self.target_device}...")
+        def pull_job(serial):
+            local_path = self.device_path(save_path, serial, multiple)
+            self.log(f"📥 Descargando {remote_path} de {serial}...")
             
-            # Comando específico para el dispositivo
-            cmd = f'adb -s "{self.target_device}" pull "{remote_path}" "{save_path}"'
-            code, stdout, stderr = self.run_command(cmd, timeout=300)
+            try:
+                algorithm = self.sync_pull(serial, remote_path, local_path, progress)
+            except (OSError, ADBError) as e:
+                error = self.transfer_error(e)
+                if os.path.exists(local_path + ".partial"):
+                    error += "\n(se reanudará al volver a descargarlo)"
+                self.log(f"❌ Error descargando de {serial}: {error}")
+                return False, f"No se pudo descargar:\n{error}"
             
-            self.root.after(0, self.progress.stop)
+            verified = f" ({algorithm} verificado)" if algorithm else ""
+            self.log(f"✅ Archivo descargado: {os.path.basename(local_path)}{verified}")
+            return True, f"Archivo guardado en:\n{local_path}"
+        
+        def pull_done(results):
+            self.root.after(0, self.finish_transfer, progress)
+            self.report_results("Descarga", results, "Descargado")
+            if self.connected:
+                self.root.after(0, lambda: self.pull_btn.config(state='normal'))
+        
+        self.run_on_devices("Descargar archivo", targets, pull_job, pull_done)
+    
+    def pull_folder(self):
+        """Descargar una carpeta completa como flujo tar extraído al vuelo"""
+        targets = self.require_targets()
+        if not targets:
+            return
+        
+        remote_dir = simpledialog.askstring("Carpeta Remota", 
+                                           "Carpeta del dispositivo:",
+                                           initialvalue="/sdcard/DCIM")
+        if not remote_dir:
+            return
+        
+        local_dir = filedialog.askdirectory(title="Carpeta local de destino")
+        if not local_dir:
+            return
+        
+        self.pull_dir_btn.config(state='disabled')
+        multiple = len(targets) > 1
+        progress = self.start_transfer()
+        
+        def pull_job(serial):
+            destination = os.path.join(local_dir, serial) if multiple else local_dir
+            self.log(f"📦 Descargando carpeta {remote_dir} de {serial}...")
             
-            if code == 0:
-                self.log(f"✅ Archivo descargado: {os.path.basename(save_path)}")
-                messagebox.showinfo("Éxito", f"Archivo guardado en:\n{save_path}")
+            try:
+                files, size, skipped = TarPull(serial, remote_dir, destination, progress).run()
+            except (OSError, ADBError, tarfile.TarError) as e:
+                error = self.transfer_error(e)
+                self.log(f"❌ Error descargando carpeta de {serial}: {error}")
+                return False, f"No se pudo descargar:\n{error}"
+            
+            omitted = f", {skipped} omitidos" if skipped else ""
+            self.log(f"✅ Carpeta descargada: {files} archivos, {format_size(size)}{omitted}")
+            return True, f"{files} archivos en:\n{destination}"
+        
+        def pull_done(results):
+            self.root.after(0, self.finish_transfer, progress)
+            self.report_results("Descarga", results, "Descargado")
+            if self.connected:
+                self.root.after(0, lambda: self.pull_dir_btn.config(state='normal'))
+        
+        self.run_on_devices("Descargar carpeta", targets, pull_job, pull_done)
+    
+    def start_transfer(self, total=0):
+        """Poner la barra en modo determinado y devolver el TransferProgress"""
+        self.progress.stop()
+        self.progress.config(mode='determinate', maximum=max(total, 1), value=0)
+        progress = TransferProgress(total, lambda *state: self.root.after(
+            0, self.show_transfer, *state, progress.entries))
+        return progress
+    
+    def show_transfer(self, done, total, rate, eta, entries=0):
+        """Mostrar bytes, archivos, MB/s y tiempo restante (hilo de Tk)"""
+        self.progress.config(maximum=max(total, 1), value=done)
+        files = f" · {entries} archivos" if entries else ""
+        self.transfer_label.config(
+            text=f"{format_size(done)} / {format_size(total)}{files} · "
+                 f"{rate / (1024 * 1024):.1f} MB/s · ETA {eta:.0f}s")
+    
+    def finish_transfer(self, progress):
+        """Dejar el resumen final y devolver la barra a su estado inicial (hilo de Tk)"""
+        self.progress.config(mode='indeterminate', value=0)
+        self.transfer_label.config(
+            text=f"{format_size(progress.done)} en {time.monotonic() - progress.started:.1f}s · "
+                 f"{progress.rate() / (1024 * 1024):.1f} MB/s")
+    
+    @staticmethod
+    def transfer_error(error):
+        """Mensaje de error de una transferencia sync"""
+        if isinstance(error, socket.timeout):
+            return f"Transferencia detenida: sin progreso en {TRANSFER_STALL_TIMEOUT}s"
+        return str(error) or error.__class__.__name__
+    
+    def sync_push(self, serial, local_path, remote_path, progress=None):
+        """Enviar un archivo con el protocolo sync; devuelve la ruta remota final.
+        
+        El plazo es por operación de socket: solo aborta si la transferencia
+        deja de avanzar durante TRANSFER_STALL_TIMEOUT segundos.
+        """
+        client = ADBClient(timeout=TRANSFER_STALL_TIMEOUT)
+        stat = os.stat(local_path)
+        codec = self.compression.codec_for(local_path, stat.st_size, self.codecs_for(serial))
+        stat_v2 = False
+        if codec:
+            try:
+                stat_v2 = "stat_v2" in client.features(serial)  # Tamaños de 64 bits
+            except (OSError, ADBError):
+                pass
+        with client.open_sync(serial) as sync, open(local_path, 'rb') as source:
+            mode, _, _ = sync.stat(remote_path)
+            if mode & 0o170000 == 0o040000:  # Es un directorio: copiar dentro
+                remote_path = f"{remote_path.rstrip('/')}/{os.path.basename(local_path)}"
+            started = time.monotonic()
+            if codec is None:
+                sync.send(source, remote_path, stat.st_mode, stat.st_mtime,
+                          progress.add if progress else None)
             else:
-                error = stderr or stdout or "Error desconocido"
-                self.log(f"❌ Error descargando: {error}")
-                messagebox.showerror("Error", f"No se pudo descargar:\n{error}")
+                # La misma sesión sync vigila cuánto lleva escrito el dispositivo
+                self.log(f"🗜️ Enviando {os.path.basename(local_path)} comprimido con {codec}")
+                remote_stat = sync.stat_v2 if stat_v2 else sync.stat
+                run_adb_transfer(serial, "push", codec, local_path, remote_path,
+                                 lambda: remote_stat(remote_path)[1], stat.st_size, progress)
+            elapsed = time.monotonic() - started
+        self.compression.record(local_path, codec, stat.st_size, elapsed)
+        return remote_path
+    
+    def codecs_for(self, serial):
+        """Códecs de 'adb push/pull -z' soportados por el servidor y el dispositivo"""
+        if serial not in self.device_codecs:
+            try:
+                features = self.adb_client.host_features() & self.adb_client.features(serial)
+            except (OSError, ADBError):
+                return set()  # Sin negociar: se reintentará en la próxima transferencia
+            self.device_codecs[serial] = {codec for codec in COMPRESSION_CODECS
+                                          if f"sendrecv_v2_{codec}" in features}
+        return self.device_codecs[serial]
+    
+    def sync_pull(self, serial, remote_path, local_path, progress=None):
+        """Descargar un archivo reanudable (plazo por falta de progreso).
+        
+        Devuelve el algoritmo con el que se verificó o None.
+        """
+        available = self.codecs_for(serial)
+        pull = ResumablePull(serial, remote_path, local_path, progress, self.log)
+        _, size, _ = pull.remote_stat()
+        codec = pull.codec = self.compression.codec_for(remote_path, size, available)
+        fresh = not os.path.exists(local_path + ".partial")  # Una reanudación no mide la velocidad real
+        algorithm = pull.run()
+        if fresh:
+            self.compression.record(remote_path, codec, size, pull.transfer_seconds)
+        return algorithm
+    
+    def open_sync_dialog(self):
+        """Ventana de opciones de la sincronización de carpetas"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Sincronizar carpeta")
+        dialog.configure(bg='#34495e')
+        dialog.transient(self.root)
+        
+        local_var = tk.StringVar()
+        remote_var = tk.StringVar(value="/sdcard/Download/")
+        direction_var = tk.StringVar(value="push")
+        mirror_var = tk.BooleanVar(value=False)
+        checksum_var = tk.BooleanVar(value=False)
+        full_var = tk.BooleanVar(value=False)
+        
+        def browse():
+            folder = filedialog.askdirectory(title="Carpeta local", parent=dialog)
+            if folder:
+                local_var.set(folder)
+        
+        def start():
+            local, remote = local_var.get().strip(), remote_var.get().strip()
+            if not local or not remote:
+                messagebox.showerror("Error", "Indica la carpeta local y la remota", parent=dialog)
+                return
+            dialog.destroy()
+            self.sync_folder(local, remote, direction_var.get(), mirror_var.get(),
+                             checksum_var.get(), not full_var.get())
+        
+        for row, (label, var) in enumerate((("Carpeta local:", local_var),
+                                            ("Carpeta en el dispositivo:", remote_var))):
+            tk.Label(dialog, text=label, fg='#ecf0f1', bg='#34495e',
+                    font=('Arial', 10)).grid(row=row, column=0, sticky='w', padx=10, pady=5)
+            tk.Entry(dialog, textvariable=var, width=40, font=('Arial', 10)).grid(
+                row=row, column=1, padx=5, pady=5)
+        tk.Button(dialog, text="📂", command=browse, bg='#9b59b6', fg='white',
+                 relief='flat').grid(row=0, column=2, padx=5)
+        
+        options = [
+            tk.Radiobutton(dialog, text="Subir (PC → dispositivo)", variable=direction_var, value="push"),
+            tk.Radiobutton(dialog, text="Bajar (dispositivo → PC)", variable=direction_var, value="pull"),
+            tk.Checkbutton(dialog, text="Borrar archivos sobrantes (espejo)", variable=mirror_var),
+            tk.Checkbutton(dialog, text="Comparar contenido con md5sum", variable=checksum_var),
+            tk.Checkbutton(dialog, text="Ignorar caché y recorrer todo el dispositivo", variable=full_var),
+        ]
+        for row, option in enumerate(options, start=2):
+            option.config(fg='#ecf0f1', bg='#34495e', selectcolor='#2c3e50',
+                          activebackground='#34495e', font=('Arial', 9))
+            option.grid(row=row, column=0, columnspan=3, sticky='w', padx=10)
+        
+        tk.Button(dialog, text="▶️ Sincronizar", command=start,
+                 bg='#16a085', fg='white', font=('Arial', 10, 'bold'),
+                 relief='flat', padx=15).grid(row=len(options) + 2, column=0, columnspan=3, pady=10)
+    
+    def sync_folder(self, local_root, remote_root, direction, mirror=False, checksum=False,
+                    use_manifest=True):
+        """Sincronizar una carpeta con los dispositivos destino"""
+        targets = self.require_targets()
+        if not targets:
+            return
+        
+        multiple = len(targets) > 1
+        if direction == "pull" and multiple:
+            local_root = os.path.join(local_root, "{serial}")
+        self.sync_btn.config(state='disabled')
+        progress = self.start_transfer()
+        
+        def sync_job(serial):
+            local = local_root.replace("{serial}", re.sub(r'[^A-Za-z0-9._-]', '_', serial))
+            arrow = "→" if direction == "push" else "←"
+            self.log(f"🔄 Sincronizando {local} {arrow} {serial}:{remote_root}...")
+            folder_sync = FolderSync(serial, local, remote_root, checksum, mirror,
+                                     use_manifest, progress)
+            try:
+                if direction == "push":
+                    copied, skipped, deleted, errors = folder_sync.push()
+                else:
+                    copied, skipped, deleted, errors = folder_sync.pull()
+            except (OSError, ADBError) as e:
+                error = self.transfer_error(e)
+                self.log(f"❌ Error sincronizando {serial}: {error}")
+                return False, f"No se pudo sincronizar:\n{error}"
             
+            for relative, error in errors.items():
+                self.log(f"❌ {serial}: {relative}: {error}")
+            summary = f"{copied} copiados, {skipped} sin cambios, {deleted} borrados"
+            self.log(f"{'✅' if not errors else '⚠️'} {serial}: {summary}")
+            if errors:
+                return False, f"{summary}, {len(errors)} errores"
+            return True, summary
+        
+        def sync_done(results):
+            self.root.after(0, self.finish_transfer, progress)
+            self.report_results("Sincronización", results, "Sincronizado")
             if self.connected:
-                self.root.after(0, lambda: self.pull_btn.config(state='normal'))
+                self.root.after(0, lambda: self.sync_btn.config(state='normal'))
         
-        threading.Thread(target=pull_thread, daemon=True).start()
+        self.run_on_devices("Sincronizar carpeta", targets, sync_job, sync_done)
     
     def device_info(self):
-        """Mostrar información del dispositivo"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        """Mostrar información de los dispositivos destino"""
+        targets = self.require_targets()
+        if not targets:
             return
         
         self.log("📱 Obteniendo información...")
         
-        def info_thread():
+        def info_job(serial):
             properties = [
                 ("ro.product.model", "Modelo"),
                 ("ro.product.manufacturer", "Fabricante"),
@@ -1081,29 +4731,33 @@ class ADBFileManagerFixed:
                 ("ro.product.brand", "Marca"),
             ]
             
-            info_text = f"📱 Información de {self.target_device}:\n" + "="*35 + "\n"
+            info_text = f"📱 Información de {serial}:\n" + "="*35 + "\n"
             
             for prop, label in properties:
-                cmd = f'adb -s "{self.target_device}" shell getprop {prop}'
+                cmd = f'adb -s "{serial}" shell getprop {prop}'
                 code, stdout, stderr = self.run_command(cmd)
                 value = stdout.strip() if code == 0 and stdout.strip() else "N/A"
                 info_text += f"{label}: {value}\n"
             
+            return True, info_text
+        
+        def info_done(results):
             self.log("✅ Información obtenida")
-            messagebox.showinfo("Info Dispositivo", info_text)
+            messagebox.showinfo("Info Dispositivo",
+                                "\n".join(results[serial][1] for serial in targets))
         
-        threading.Thread(target=info_thread, daemon=True).start()
+        self.run_on_devices("Info dispositivo", targets, info_job, info_done)
     
     def list_apps(self):
         """Listar aplicaciones instaladas"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        targets = self.require_targets()
+        if not targets:
             return
         
         self.log("📋 Obteniendo aplicaciones...")
         
-        def list_thread():
-            cmd = f'adb -s "{self.target_device}" shell pm list packages -3'
+        def list_job(serial):
+            cmd = f'adb -s "{serial}" shell pm list packages -3'
             code, stdout, stderr = self.run_command(cmd)
             
             if code == 0:
@@ -1111,23 +4765,27 @@ class ADBFileManagerFixed:
                            if line.startswith('package:')]
                 
                 packages.sort()
-                apps_text = f"📱 Apps en {self.target_device} ({len(packages)}):\n" + "="*40 + "\n"
+                apps_text = f"📱 Apps en {serial} ({len(packages)}):\n" + "="*40 + "\n"
                 apps_text += "\n".join(packages[:25])
                 
                 if len(packages) > 25:
                     apps_text += f"\n... y {len(packages) - 25} más"
                 
-                self.log(f"✅ {len(packages)} aplicaciones encontradas")
-                messagebox.showinfo("Apps Instaladas", apps_text)
-            else:
-                self.log("❌ Error obteniendo aplicaciones")
+                self.log(f"✅ {len(packages)} aplicaciones encontradas en {serial}")
+                return True, apps_text
+            self.log(f"❌ Error obteniendo aplicaciones de {serial}")
+            return False, f"❌ {serial}: error obteniendo aplicaciones"
         
-        threading.Thread(target=list_thread, daemon=True).start()
+        def list_done(results):
+            messagebox.showinfo("Apps Instaladas",
+                                "\n\n".join(results[serial][1] for serial in targets))
+        
+        self.run_on_devices("Listar apps", targets, list_job, list_done)
     
     def screenshot(self):
         """Tomar captura de pantalla"""
-        if not self.connected or not self.target_device:
-            messagebox.showerror("Error", "Dispositivo no conectado")
+        targets = self.require_targets()
+        if not targets:
             return
         
         save_path = filedialog.asksaveasfilename(
@@ -1140,32 +4798,202 @@ class ADBFileManagerFixed:
             return
         
         self.log("📸 Tomando captura...")
+        multiple = len(targets) > 1
         
-        def screenshot_thread():
-            temp_path = "/sdcard/temp_screenshot.png"
-            
-            # Tomar captura
-            cmd1 = f'adb -s "{self.target_device}" shell screencap -p {temp_path}'
-            code, stdout, stderr = self.run_command(cmd1)
+        def screenshot_job(serial):
+            local_path = self.device_path(save_path, serial, multiple)
+            # El PNG llega por exec: sin archivo temporal en el dispositivo
+            # ni la conversión de saltos de línea de shell:
+            temp_path = f"{local_path}.{uuid.uuid4().hex[:8]}.part"
+            try:
+                with open(temp_path, 'wb') as target:
+                    self.adb_client.exec_to_file(serial, "screencap -p", target)
+                with open(temp_path, 'rb') as f:
+                    if f.read(8) != PNG_SIGNATURE:
+                        raise ADBError("screencap no devolvió un PNG")
+                os.replace(temp_path, local_path)
+            except (OSError, ADBError) as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                self.log(f"❌ Error tomando captura en {serial}: {e}")
+                return False, f"Error tomando captura:\n{e}"
             
-            if code == 0:
-                # Descargar
-                cmd2 = f'adb -s "{self.target_device}" pull {temp_path} "{save_path}"'
-                code, stdout, stderr = self.run_command(cmd2)
-                
-                if code == 0:
-                    # Limpiar
-                    cmd3 = f'adb -s "{self.target_device}" shell rm {temp_path}'
-                    self.run_command(cmd3)
-                    
-                    self.log("✅ Captura guardada")
-                    messagebox.showinfo("Éxito", f"Captura guardada en:\n{save_path}")
-                else:
-                    self.log("❌ Error descargando captura")
-            else:
-                self.log("❌ Error tomando captura")
+            self.log(f"✅ Captura guardada ({serial})")
+            return True, f"Captura guardada en:\n{local_path}"
+        
+        def screenshot_done(results):
+            self.report_results("Captura", results, "Capturado")
+        
+        self.run_on_devices("Captura", targets, screenshot_job, screenshot_done)
+    
+    def toggle_burst(self):
+        """Iniciar o detener la ráfaga de capturas de los dispositivos elegidos"""
+        if self.burst_stop:
+            self.burst_stop.set()
+            self.log("⏹️ Deteniendo ráfaga...")
+            return
+        
+        targets = self.require_targets()
+        if not targets:
+            return
+        
+        directory = filedialog.askdirectory(title="Carpeta para las capturas")
+        if not directory:
+            return
+        
+        fps = simpledialog.askinteger("Ráfaga", "Capturas por segundo:",
+                                      initialvalue=BURST_FPS, minvalue=1, maxvalue=30)
+        if not fps:
+            return
+        
+        image_format = "png"
+        if Image is not None and messagebox.askyesno("Formato", "¿Guardar en WebP? (No: PNG)"):
+            image_format = "webp"
+        
+        if self.encoder is None:
+            self.encoder = ProcessPoolExecutor(max_workers=os.cpu_count())
+        stop = self.burst_stop = threading.Event()
+        self.burst_btn.config(text="⏹️ Parar Ráfaga")
+        self.log(f"🎞️ Ráfaga de {fps} capturas/s en {directory}")
+        results = {}
+        lock = threading.Lock()
         
-        threading.Thread(target=screenshot_thread, daemon=True).start()
+        def burst_job(serial):
+            capture = BurstCapture(serial, directory, self.encoder, fps, image_format, stop)
+            try:
+                saved, repeated = capture.run()
+                self.log(f"✅ Ráfaga de {serial}: {saved} capturas, {repeated} repetidas descartadas")
+                result = (True, f"{saved} capturas guardadas en:\n{directory}")
+            except Exception as e:
+                self.log(f"❌ Ráfaga de {serial} interrumpida: {e}")
+                result = (False, f"Ráfaga interrumpida:\n{e}")
+            with lock:
+                results[serial] = result
+                finished = len(results) == len(targets)
+            if finished:
+                self.root.after(0, self.finish_burst)
+                self.report_results("Ráfaga", results, "Capturado")
+        
+        # Un hilo propio por dispositivo (como la vista previa): la ráfaga dura
+        # hasta que se para y no debe ocupar ni esperar hilos del JobPool
+        for serial in targets:
+            threading.Thread(target=burst_job, args=(serial,), daemon=True).start()
+    
+    def finish_burst(self):
+        """Dejar el botón de ráfaga listo para otra (hilo de Tk)"""
+        self.burst_stop = None
+        self.burst_btn.config(text="🎞️ Ráfaga")
+    
+    def toggle_recording(self):
+        """Iniciar o detener la grabación de pantalla de los dispositivos elegidos"""
+        if self.recorders:
+            self.log("⏹️ Deteniendo grabación...")
+            for recorder in self.recorders:
+                recorder.stop()
+            return
+        
+        targets = self.require_targets()
+        if not targets:
+            return
+        
+        directory = filedialog.askdirectory(title="Carpeta para las grabaciones")
+        if not directory:
+            return
+        join = messagebox.askyesno("Grabación", "¿Unir los segmentos en un solo MP4 al terminar?\n"
+                                                "(necesita ffmpeg)")
+        
+        recorders = self.recorders = [SegmentedRecorder(serial, directory, join, self.log)
+                                      for serial in targets]
+        self.record_btn.config(text="⏹️ Parar Grabación")
+        self.log(f"🎬 Grabando en segmentos de {RECORD_SEGMENT_SECONDS}s en {directory}")
+        results = {}
+        lock = threading.Lock()
+        
+        def record_job(recorder):
+            try:
+                segments, joined = recorder.run()
+                saved = joined or f"{len(segments)} segmentos en {directory}"
+                self.log(f"✅ Grabación de {recorder.serial}: {saved}")
+                result = (True, f"Grabación guardada:\n{saved}")
+            except Exception as e:
+                self.log(f"❌ Grabación de {recorder.serial} interrumpida: {e}")
+                result = (False, f"Grabación interrumpida:\n{e}")
+            with lock:
+                results[recorder.serial] = result
+                finished = len(results) == len(recorders)
+            if finished:
+                self.root.after(0, self.finish_recording, recorders)
+                self.report_results("Grabación", results, "Grabado")
+        
+        # Hilos propios, como la ráfaga: la grabación dura hasta que se para
+        for recorder in recorders:
+            threading.Thread(target=record_job, args=(recorder,), daemon=True).start()
+    
+    def finish_recording(self, recorders):
+        """Dejar el botón de grabación listo para otra (hilo de Tk)"""
+        if self.recorders is recorders:
+            self.recorders = []
+            self.record_btn.config(text="🎬 Grabar")
+    
+    def open_preview(self):
+        """Ventana con la pantalla del dispositivo en vivo"""
+        if self.preview:
+            self.log("📺 La vista previa ya está abierta")
+            return
+        if av is None:
+            messagebox.showerror("Vista previa", "La vista previa necesita PyAV:\npip install av")
+            return
+        targets = self.require_targets()
+        if not targets:
+            return
+        serial = targets[0]
+        if len(targets) > 1:
+            self.log(f"📺 Vista previa solo de {serial}")
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Vista previa - {serial}")
+        window.configure(bg='#2c3e50')
+        window.geometry("400x720")
+        pane = tk.Label(window, bg='black')
+        pane.pack(fill='both', expand=True)
+        status = tk.Label(window, text="Conectando...", fg='#95a5a6', bg='#2c3e50',
+                          font=('Consolas', 9))
+        status.pack(fill='x')
+        
+        preview = self.preview = ScreenPreview(
+            serial, lambda message: self.log(f"❌ Vista previa de {serial}: {message}"))
+        
+        def resize(event):
+            if event.widget is pane:
+                preview.size = (max(event.width, 16), max(event.height, 16))
+        
+        def pump():
+            if self.preview is not preview:
+                return
+            if not preview.running.is_set():
+                close()
+                return
+            frame = preview.take()
+            if frame:
+                width, height, ppm = frame
+                image = tk.PhotoImage(data=ppm, format='ppm')
+                pane.config(image=image)
+                pane.image = image  # Mantener la referencia
+                status.config(text=f"{width}x{height} · mostrados {preview.shown} · "
+                                   f"descartados {preview.dropped}")
+            self.root.after(PREVIEW_POLL_MS, pump)
+        
+        def close():
+            preview.stop()
+            if self.preview is preview:
+                self.preview = None
+                window.destroy()
+        
+        pane.bind('<Configure>', resize)
+        window.protocol("WM_DELETE_WINDOW", close)
+        self.log(f"📺 Vista previa de {serial}")
+        preview.start()
+        pump()
     
     def restart_adb(self):
         """Reiniciar ADB"""
@@ -1173,16 +5001,23 @@ class ADBFileManagerFixed:
         
         def restart_thread():
             self.run_command("adb kill-server")
-            time.sleep(2)
+            self.wait_phase("Servidor ADB detenido", self.server_down, 5)
             code, stdout, stderr = self.run_command("adb start-server")
             
             if code == 0:
+                self.wait_phase("Servidor ADB aceptando conexiones", self.server_ready, 10)
                 self.log("✅ ADB reiniciado")
                 self.show_current_devices()
             else:
                 self.log("❌ Error reiniciando ADB")
         
-        threading.Thread(target=restart_thread, daemon=True).start()
+        self.run_job("Reiniciar ADB", restart_thread)
+    
+    def fill_endpoint(self, ip, port):
+        """Rellenar IP y puerto encontrados en los campos de conexión"""
+        self.device_ip.set(ip)
+        self.device_port.set(str(port))
+        self.port_entry.config(fg='black')
     
     def scan_network(self):
         """Escanear red buscando dispositivos"""
@@ -1191,47 +5026,84 @@ class ADBFileManagerFixed:
             return
         
         ip_base = ".".join(self.device_ip.get().split('.')[:-1]) + "."
+        
+        port_range = None
+        if self.scan_wide_ports.get():
+            default_range = f"{WIRELESS_PORT_RANGE[0]}-{WIRELESS_PORT_RANGE[1]}"
+            range_text = simpledialog.askstring("Puertos WiFi",
+                                                "Rango de puertos a barrer:",
+                                                initialvalue=default_range)
+            if not range_text:
+                return
+            try:
+                first, last = (int(value) for value in range_text.split('-'))
+                if not 0 < first <= last < 65536:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "Rango de puertos no válido (ej. 30000-49999)")
+                return
+            port_range = (first, last)
+        
         self.log(f"🔍 Escaneando red {ip_base}0/24...")
         
         def scan_thread():
             found_devices = []
             adb_ports = []
+            progress = {'done': 0}
             
-            for i in range(1, 255):
-                ip = f"{ip_base}{i}"
-                try:
-                    # Ping rápido
-                    ping_cmd = f"ping -c 1 -W 1 {ip}" if platform.system() != "Windows" else f"ping -n 1 -w 1000 {ip}"
-                    code, stdout, stderr = self.run_command(ping_cmd, timeout=2)
+            def on_result(ip, port, state):
+                progress['done'] += 1
+                if state:
+                    found_devices.append(ip)
+                    self.log(f"📱 Encontrado: {ip}")
+                
+                if state == NetworkScanner.ADB:
+                    adb_ports.append(f"{ip}:{port}")
+                    self.log(f"🎯 ADB disponible: {ip}:{port}")
                     
-                    if code == 0:
-                        found_devices.append(ip)
-                        self.log(f"📱 Encontrado: {ip}")
-                        
-                        # Verificar puerto 5555 (ADB)
-                        try:
-                            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                            sock.settimeout(1)
-                            if sock.connect_ex((ip, 5555)) == 0:
-                                adb_ports.append(f"{ip}:5555")
-                                self.log(f"🎯 ADB disponible: {ip}:5555")
-                                
-                                # Auto-rellenar si es el primero
-                                if not adb_ports[:-1]:  # Si es el primero
-                                    self.device_ip.set(ip)
-                                    self.device_port.set("5555")
-                                    self.port_entry.config(fg='black')
-                            sock.close()
-                        except:
-                            pass
-                except:
-                    continue
+                    # Auto-rellenar si es el primero
+                    if len(adb_ports) == 1:
+                        self.root.after(0, self.fill_endpoint, ip, port)
                 
                 # Mostrar progreso cada 50 IPs
-                if i % 50 == 0:
-                    self.log(f"🔍 Progreso: {i}/254...")
+                if progress['done'] % 50 == 0:
+                    self.log(f"🔍 Progreso: {progress['done']}/254...")
+            
+            started = time.monotonic()
+            hosts = [f"{ip_base}{i}" for i in range(1, 255)]
+            try:
+                NetworkScanner(cancelled=self.jobs.cancelled).scan(
+                    hosts, (ADB_TCP_PORT,), on_result, confirm=True)
+            except Exception as e:
+                self.log(f"❌ Error escaneando: {e}")
+                return
+            
+            # Barrido de puertos de depuración inalámbrica en los hosts activos
+            if port_range and found_devices and not self.jobs.cancelled():
+                first, last = port_range
+                total = len(found_devices) * (last - first + 1)
+                self.log(f"🔍 Buscando puertos ADB {first}-{last} en {len(found_devices)} hosts...")
+                wide = {'done': 0}
+                
+                def on_port_result(ip, port, state):
+                    wide['done'] += 1
+                    if state == NetworkScanner.ADB:
+                        adb_ports.append(f"{ip}:{port}")
+                        self.log(f"🎯 ADB inalámbrico: {ip}:{port}")
+                        if len(adb_ports) == 1:
+                            self.root.after(0, self.fill_endpoint, ip, port)
+                    if wide['done'] % 5000 == 0:
+                        self.log(f"🔍 Puertos: {wide['done']}/{total}...")
+                
+                try:
+                    NetworkScanner(cancelled=self.jobs.cancelled).discover_adb_ports(
+                        found_devices, port_range, on_port_result)
+                except Exception as e:
+                    self.log(f"❌ Error barriendo puertos: {e}")
             
-            self.log(f"✅ Escaneo completado:")
+            if self.jobs.cancelled():
+                self.log("⏹️ Escaneo cancelado")
+            self.log(f"✅ Escaneo completado en {time.monotonic() - started:.1f}s:")
             self.log(f"   📱 {len(found_devices)} dispositivos activos")
             self.log(f"   🎯 {len(adb_ports)} con ADB disponible")
             
@@ -1240,9 +5112,13 @@ class ADBFileManagerFixed:
                 for device in adb_ports:
                     self.log(f"   🔗 {device}")
         
-        threading.Thread(target=scan_thread, daemon=True).start()
+        self.run_job("Escanear red", scan_thread, priority=PRIORITY_BACKGROUND)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Pool de procesos en el ejecutable empaquetado
+    if "--benchmark-logcat" in sys.argv:
+        benchmark_logcat()
+        sys.exit(0)
     root = tk.Tk()
     app = ADBFileManagerFixed(root)
     root.mainloop()
\ No newline at end of file